@@ -0,0 +1,74 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import copy_context
+from functools import partial
+from time import perf_counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+
+ASYNC_READ_ROUTES = (
+    "tags-list",
+    "tags-detail",
+    "ingredients-list",
+    "ingredients-detail",
+    "recipes-list",
+    "recipes-detail",
+)
+READ_METHODS = ("GET", "HEAD")
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.ASYNC_READ_WORKERS,
+            thread_name_prefix="async-reads",
+        )
+    return _executor
+
+
+def _render_read(view, request, *args, **kwargs):
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, "render") and callable(response.render):
+            started = perf_counter()
+            response = response.render()
+            request.render_time = perf_counter() - started
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_read_view(view):
+    async def async_view(request, *args, **kwargs):
+        if request.method not in READ_METHODS:
+            return await sync_to_async(view)(request, *args, **kwargs)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            get_executor(),
+            partial(
+                copy_context().run,
+                _render_read,
+                view,
+                request,
+                *args,
+                **kwargs,
+            ),
+        )
+
+    async_view.csrf_exempt = getattr(view, "csrf_exempt", False)
+    return async_view
+
+
+def with_async_reads(patterns, names=ASYNC_READ_ROUTES):
+    if not settings.ASYNC_READ_WORKERS:
+        return patterns
+    for pattern in patterns:
+        if pattern.name in names:
+            pattern.callback = async_read_view(pattern.callback)
+    return patterns
@@ -0,0 +1,114 @@
+from collections import OrderedDict
+from copy import copy
+from datetime import timedelta
+from threading import Lock
+from time import monotonic
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from rest_framework.authentication import TokenAuthentication
+
+from api.models import TokenRevocation
+
+REVOCATIONS_PRUNE_EVERY = 100
+
+
+class TokenCache:
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._lock = Lock()
+        self._revoked = None
+        self._synced = None
+        self._entries = OrderedDict()
+
+    def _sync(self):
+        now = monotonic()
+        if (
+            self._synced is not None
+            and now - self._synced < settings.VERSION_CHECK_INTERVAL
+        ):
+            return
+        self._synced = now
+        revocations = TokenRevocation.objects.order_by("id")
+        if self._revoked is None:
+            self._revoked = (
+                revocations.values_list("id", flat=True).last() or 0
+            )
+            return
+        found = list(
+            revocations.filter(id__gt=self._revoked).values_list(
+                "id", "user_id", "key"
+            )
+        )
+        if not found:
+            return
+        self._revoked = found[-1][0]
+        self._evict(
+            {key for _, _, key in found if key},
+            {user for _, user, key in found if not key},
+        )
+
+    def _evict(self, keys, users):
+        for key, (_, user, _) in list(self._entries.items()):
+            if key in keys or user.id in users:
+                del self._entries[key]
+
+    def get(self, key):
+        with self._lock:
+            self._sync()
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires, user, token = entry
+            if expires < monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+        return copy(user), token
+
+    def set(self, key, user, token):
+        with self._lock:
+            self._entries[key] = (monotonic() + self.ttl, copy(user), token)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def revoke(self, user_id, key=""):
+        with self._lock:
+            if key:
+                self._entries.pop(key, None)
+            else:
+                self._evict(set(), {user_id})
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._revoked = None
+            self._synced = None
+
+
+token_cache = TokenCache(settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TTL)
+
+
+@transaction.atomic
+def revoke_tokens(user_id, key=""):
+    TokenRevocation.objects.select_for_update().order_by("-id").first()
+    revocation = TokenRevocation.objects.create(user_id=user_id, key=key)
+    if revocation.id % REVOCATIONS_PRUNE_EVERY == 0:
+        TokenRevocation.objects.filter(
+            created__lt=timezone.now()
+            - timedelta(seconds=2 * settings.TOKEN_CACHE_TTL)
+        ).delete()
+    token_cache.revoke(user_id, key)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    def authenticate_credentials(self, key):
+        cached = token_cache.get(key)
+        if cached is not None:
+            return cached
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user, token)
+        return user, token
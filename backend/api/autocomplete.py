@@ -0,0 +1,65 @@
+from bisect import bisect_left
+from threading import Lock
+
+from django.conf import settings
+
+from api.cache import get_version
+from recipes.models import Ingredient
+
+INGREDIENTS_VERSION_KEY = "ingredients_version"
+
+
+class IngredientIndex:
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._keys = []
+        self._rows = []
+
+    def _load(self, version):
+        rows = sorted(
+            (
+                {"id": pk, "name": name, "measurement_unit": unit}
+                for pk, name, unit in Ingredient.objects.order_by()
+                .values_list("id", "name", "measurement_unit")
+                .iterator()
+            ),
+            key=lambda row: (row["name"].casefold(), row["id"]),
+        )
+        self._keys, self._rows, self._version = (
+            [row["name"].casefold() for row in rows],
+            rows,
+            version,
+        )
+
+    def _refresh(self):
+        version = get_version(INGREDIENTS_VERSION_KEY)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._load(version)
+        return self._keys, self._rows
+
+    def search(self, query, limit=None):
+        limit = limit or settings.INGREDIENTS_AUTOCOMPLETE_LIMIT
+        keys, rows = self._refresh()
+        query = query.casefold()
+        found = []
+        index = bisect_left(keys, query)
+        while (
+            index < len(keys)
+            and len(found) < limit
+            and keys[index].startswith(query)
+        ):
+            found.append(rows[index])
+            index += 1
+        if len(found) < limit:
+            for key, row in zip(keys, rows):
+                if query in key and not key.startswith(query):
+                    found.append(row)
+                    if len(found) == limit:
+                        break
+        return found
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,162 @@
+import tracemalloc
+from time import perf_counter
+
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.authtoken.models import Token
+from rest_framework.pagination import Cursor
+from rest_framework.test import APIClient
+
+from api.pagination import LimitCursorPagination, RecipePagination
+from foodgram.settings import DEFAULT_PAGE_SIZE
+from recipes.models import Recipe, Tag
+
+User = get_user_model()
+
+PERCENTILES = (50, 95, 99)
+DEEP_PAGE = 5000
+
+
+def get_deep_pages(url):
+    page = min(DEEP_PAGE, Recipe.objects.count() // DEFAULT_PAGE_SIZE)
+    if page < 2:
+        return {}
+    ordering = RecipePagination.cursor_ordering
+    previous = Recipe.objects.order_by(*ordering).only(
+        *(field.lstrip("-") for field in ordering)
+    )[(page - 1) * DEFAULT_PAGE_SIZE - 1]
+    paginator = LimitCursorPagination(ordering)
+    paginator.base_url = url
+    position = paginator._get_position_from_instance(previous, ordering)
+    return {
+        "recipes cursor": f"{url}?cursor=",
+        f"recipes page {page}": f"{url}?page={page}",
+        f"recipes cursor page {page}": paginator.encode_cursor(
+            Cursor(offset=0, reverse=False, position=position)
+        ),
+    }
+
+
+def get_endpoints():
+    recipe = Recipe.objects.order_by("-favorites_count", "id").first()
+    tags = "&".join(
+        f"tags={slug}"
+        for slug in Tag.objects.order_by("id").values_list("slug", flat=True)[
+            :3
+        ]
+    )
+    recipes = reverse("api:recipes-list")
+    return {
+        "recipes list": recipes,
+        **get_deep_pages(recipes),
+        "recipes list anonymous": (recipes, False),
+        "recipes list by tags": f"{recipes}?{tags}",
+        "recipes list favorited": f"{recipes}?is_favorited=1",
+        "recipes search": f"{recipes}?search=recipe",
+        "recipe detail": reverse("api:recipes-detail", args=[recipe.id]),
+        "subscriptions": (
+            f"{reverse('api:users-subscriptions')}?recipes_limit=3"
+        ),
+        "download shopping cart": reverse(
+            "api:recipes-download-shopping-cart"
+        ),
+        "tags": reverse("api:tags-list"),
+        "ingredients search": (
+            f"{reverse('api:ingredients-list')}?name=Seed ingredient 1"
+        ),
+    }
+
+
+def get_benchmark_user():
+    return (
+        User.objects.filter(shopping_cart__isnull=False)
+        .order_by("-followers_count", "id")
+        .first()
+    )
+
+
+def get_client(user=None):
+    client = APIClient()
+    if user is not None:
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    return client
+
+
+def request(client, url):
+    response = client.get(url)
+    if response.streaming:
+        b"".join(response.streaming_content)
+    if response.status_code != 200:
+        raise ValueError(f"GET {url} returned {response.status_code}")
+    return response
+
+
+def percentile(values, rank):
+    values = sorted(values)
+    index = max(0, -(-len(values) * rank // 100) - 1)
+    return values[index]
+
+
+def measure(client, url, iterations, warmup):
+    for _ in range(warmup):
+        request(client, url)
+    timings = []
+    queries = []
+    for _ in range(iterations):
+        with CaptureQueriesContext(connection) as context:
+            started = perf_counter()
+            request(client, url)
+            timings.append((perf_counter() - started) * 1000)
+        queries.append(len(context.captured_queries))
+    tracemalloc.start()
+    try:
+        allocations = []
+        for _ in range(max(1, iterations // 10)):
+            tracemalloc.reset_peak()
+            before, _ = tracemalloc.get_traced_memory()
+            request(client, url)
+            _, peak = tracemalloc.get_traced_memory()
+            allocations.append(peak - before)
+    finally:
+        tracemalloc.stop()
+    result = {
+        "url": url,
+        "iterations": iterations,
+        "mean_ms": round(sum(timings) / len(timings), 3),
+        "max_queries": max(queries),
+        "peak_alloc_kb": round(max(allocations) / 1024, 1),
+    }
+    for rank in PERCENTILES:
+        result[f"p{rank}_ms"] = round(percentile(timings, rank), 3)
+    return result
+
+
+def run_benchmark(iterations=50, warmup=5, only=None):
+    user = get_benchmark_user()
+    clients = {True: get_client(user), False: get_client()}
+    results = {}
+    for name, endpoint in get_endpoints().items():
+        if only and name not in only:
+            continue
+        url, authenticated = (
+            endpoint if isinstance(endpoint, tuple) else (endpoint, True)
+        )
+        results[name] = measure(
+            clients[authenticated], url, iterations, warmup
+        )
+    return results
+
+
+def compare(results, baseline):
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        yield name, {
+            key: (previous[key], result[key])
+            for key in ("p50_ms", "p95_ms", "p99_ms", "max_queries")
+            if key in previous
+        }
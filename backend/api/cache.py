@@ -0,0 +1,34 @@
+from time import monotonic
+from uuid import uuid4
+
+from django.conf import settings
+
+from api.models import Version
+
+_checked = {}
+
+
+def get_version(key):
+    checked = _checked.get(key)
+    if (
+        checked is not None
+        and monotonic() - checked[1] < settings.VERSION_CHECK_INTERVAL
+    ):
+        return checked[0]
+    version = (
+        Version.objects.filter(key=key).values_list("value", flat=True).first()
+        or ""
+    )
+    _checked[key] = (version, monotonic())
+    return version
+
+
+def bump_version(key):
+    Version.objects.update_or_create(
+        key=key, defaults={"value": uuid4().hex}
+    )
+    _checked.pop(key, None)
+
+
+def clear_versions():
+    _checked.clear()
@@ -1,6 +1,25 @@
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import FilterSet, filters
+from rest_framework.filters import OrderingFilter
 
-from recipes.models import Ingredient, Recipe, Tag
+from api.pagination import LimitCursorPagination
+from api.tags import tag_cache
+from recipes.models import Ingredient, Recipe
+
+TAGS_MODE_ANY = "any"
+TAGS_MODE_ALL = "all"
+
+
+def tag_choices():
+    return tag_cache.choices()
+
+
+def tagged_with(tags):
+    return Exists(
+        Recipe.tags.through.objects.filter(
+            recipe=OuterRef("pk"), tag__in=tags
+        )
+    )
 
 
 class IngredientFilter(FilterSet):
@@ -12,12 +31,16 @@ class IngredientFilter(FilterSet):
 
 
 class RecipeFilter(FilterSet):
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name="tags__slug",
-        to_field_name="slug",
-        queryset=Tag.objects.all(),
+    tags = filters.MultipleChoiceFilter(
+        choices=tag_choices,
+        method="filter_tags",
+    )
+    tags_mode = filters.ChoiceFilter(
+        choices=((TAGS_MODE_ANY, "any"), (TAGS_MODE_ALL, "all")),
+        method="filter_tags_mode",
     )
 
+    search = filters.CharFilter(method="filter_search")
     is_favorited = filters.BooleanFilter(method="filter_is_favorited")
     is_in_shopping_cart = filters.BooleanFilter(
         method="filter_is_in_shopping_cart",
@@ -30,6 +53,23 @@ class RecipeFilter(FilterSet):
             "author",
         )
 
+    def filter_tags(self, queryset, name, value):
+        tags = [tag.id for tag in tag_cache.get_by_slugs(value)]
+        if self.form.cleaned_data.get("tags_mode") == TAGS_MODE_ALL:
+            for tag in tags:
+                queryset = queryset.filter(tagged_with([tag]))
+            return queryset
+        return queryset.filter(tagged_with(tags))
+
+    def filter_tags_mode(self, queryset, name, value):
+        return queryset
+
+    def filter_search(self, queryset, name, value):
+        value = value.strip()
+        if value:
+            return queryset.search(value)
+        return queryset
+
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
         if value and not user.is_anonymous:
@@ -41,3 +81,24 @@ class RecipeFilter(FilterSet):
         if value and not user.is_anonymous:
             return queryset.filter(shopping_cart__user=user)
         return queryset
+
+
+class RecipeOrderingFilter(OrderingFilter):
+    def get_ordering(self, request, queryset, view):
+        params = request.query_params
+        if (
+            params.get("search", "").strip()
+            and not params.get(self.ordering_param)
+            and LimitCursorPagination.cursor_query_param not in params
+        ):
+            return None
+        ordering = super().get_ordering(request, queryset, view)
+        fields = {field.lstrip("-") for field in ordering}
+        return [
+            *ordering,
+            *(
+                field
+                for field in self.get_default_ordering(view)
+                if field.lstrip("-") not in fields
+            ),
+        ]
@@ -0,0 +1,88 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from PIL import Image
+
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.RECIPE_IMAGE_WORKERS,
+            thread_name_prefix="recipe-images",
+        )
+    return _executor
+
+
+def variant_name(name, suffix=""):
+    return f"{name}{suffix}.webp"
+
+
+def save_webp(image, name):
+    buffer = BytesIO()
+    image.save(buffer, "WEBP", quality=settings.RECIPE_IMAGE_WEBP_QUALITY)
+    return default_storage.save(name, ContentFile(buffer.getvalue()))
+
+
+def delete_variants(image, *variants):
+    for name in set(variants) - {"", image}:
+        default_storage.delete(name)
+
+
+def discard_image_variants(recipe):
+    image = recipe.image.name
+    variants = recipe.thumbnail.name, recipe.webp.name
+    recipe.thumbnail = recipe.webp = ""
+    transaction.on_commit(lambda: delete_variants(image, *variants))
+
+
+def process_recipe_image(recipe_id, name):
+    with default_storage.open(name) as file, Image.open(file) as image:
+        image = image.convert("RGBA" if "A" in image.getbands() else "RGB")
+        webp = save_webp(image, variant_name(name))
+        image.thumbnail(settings.RECIPE_THUMBNAIL_SIZE)
+        thumbnail = save_webp(image, variant_name(name, ".thumb"))
+    with transaction.atomic():
+        previous = (
+            Recipe.objects.select_for_update()
+            .filter(id=recipe_id, image=name)
+            .values_list("thumbnail", "webp")
+            .first()
+        )
+        if previous is not None:
+            Recipe.objects.filter(id=recipe_id).update(
+                thumbnail=thumbnail, webp=webp
+            )
+    delete_variants(name, *(previous or (thumbnail, webp)))
+
+
+def _process_in_worker(recipe_id, name):
+    try:
+        process_recipe_image(recipe_id, name)
+    except Exception:
+        logger.exception("Failed to process image %s", name)
+    finally:
+        connections.close_all()
+
+
+def schedule_image_processing(recipe):
+    recipe_id, name = recipe.id, recipe.image.name
+
+    def submit():
+        if settings.RECIPE_IMAGE_WORKERS:
+            get_executor().submit(_process_in_worker, recipe_id, name)
+        else:
+            process_recipe_image(recipe_id, name)
+
+    transaction.on_commit(submit)
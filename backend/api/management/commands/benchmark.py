@@ -0,0 +1,114 @@
+import json
+import platform
+from datetime import datetime, timezone
+from pathlib import Path
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_databases, teardown_databases
+
+from api.benchmark import compare, run_benchmark
+from api.seeding import seed_dataset
+
+SIZES = (
+    ("users", 200),
+    ("recipes", 5000),
+    ("ingredients", 500),
+    ("ingredients_per_recipe", 8),
+    ("tags", 6),
+    ("follows", 10),
+    ("favorites", 20),
+    ("carts", 5),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database with a deterministic dataset, "
+        "drive the API endpoints in-process and report latency "
+        "percentiles, queries and allocations per endpoint"
+    )
+
+    def add_arguments(self, parser):
+        for size, default in SIZES:
+            parser.add_argument(
+                f"--{size.replace('_', '-')}", type=int, default=default
+            )
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--skew", type=float, default=1.0)
+        parser.add_argument("--iterations", type=int, default=50)
+        parser.add_argument("--warmup", type=int, default=5)
+        parser.add_argument(
+            "--endpoint",
+            action="append",
+            default=[],
+            help="Only run the named endpoint, may be repeated",
+        )
+        parser.add_argument("--output", help="Write JSON results to a file")
+        parser.add_argument(
+            "--compare", help="Previous JSON results to compare against"
+        )
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options["compare"]:
+            try:
+                baseline = json.loads(Path(options["compare"]).read_text())
+            except (OSError, ValueError) as error:
+                raise CommandError(f"Cannot read baseline: {error}")
+        sizes = {size: options[size] for size, _ in SIZES}
+        old_config = setup_databases(
+            verbosity=0, interactive=False, aliases={"default"}
+        )
+        try:
+            started = datetime.now(timezone.utc)
+            self.stdout.write(f"Seeding {sizes} with seed {options['seed']}")
+            seed_dataset(seed=options["seed"], skew=options["skew"], **sizes)
+            results = run_benchmark(
+                options["iterations"],
+                options["warmup"],
+                options["endpoint"],
+            )
+            report = {
+                "started": started.isoformat(),
+                "database": connection.vendor,
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "seed": options["seed"],
+                "skew": options["skew"],
+                "sizes": sizes,
+                "results": results,
+            }
+        finally:
+            teardown_databases(old_config, verbosity=0)
+        self.print_results(results)
+        if baseline is not None:
+            self.print_comparison(results, baseline["results"])
+        if options["output"]:
+            Path(options["output"]).write_text(
+                json.dumps(report, indent=2, ensure_ascii=False)
+            )
+            self.stdout.write(
+                self.style.SUCCESS(f"Results saved to {options['output']}")
+            )
+
+    def print_results(self, results):
+        self.stdout.write(
+            f"{'endpoint':<26}{'p50':>9}{'p95':>9}{'p99':>9}"
+            f"{'queries':>9}{'alloc KB':>10}"
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f"{name:<26}{result['p50_ms']:>9.2f}{result['p95_ms']:>9.2f}"
+                f"{result['p99_ms']:>9.2f}{result['max_queries']:>9}"
+                f"{result['peak_alloc_kb']:>10.1f}"
+            )
+
+    def print_comparison(self, results, baseline):
+        for name, changes in compare(results, baseline):
+            line = ", ".join(
+                f"{key} {before} -> {after}"
+                for key, (before, after) in changes.items()
+            )
+            self.stdout.write(f"{name}: {line}")
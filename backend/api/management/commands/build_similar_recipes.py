@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from api.similarity import build_similarity_index
+
+
+class Command(BaseCommand):
+    help = "Rebuild the precomputed similar recipes table"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--top-k", type=int)
+        parser.add_argument(
+            "--max-postings",
+            type=int,
+            help="Most recent recipes scanned per ingredient",
+        )
+
+    def handle(self, *args, **options):
+        recipes, created = build_similarity_index(
+            options["top_k"], options["max_postings"], log=self.stdout.write
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Indexed {recipes} recipes, stored {created} similar pairs"
+            )
+        )
@@ -0,0 +1,122 @@
+import re
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import F
+from django.test import RequestFactory
+
+from api.filters import RecipeFilter
+from api.services import get_live_shopping_cart_totals, get_user_shopping_cart
+from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
+
+User = get_user_model()
+
+SMALL_TABLES = {Tag._meta.db_table}
+SEQUENTIAL_SCAN = {
+    "postgresql": re.compile(r"Seq Scan on (\w+)"),
+    "sqlite": re.compile(r"\bSCAN (?:TABLE )?(\w+)(?! USING)(?!\w)"),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "EXPLAIN the hot API queries and fail if any of them falls back "
+        "to a sequential scan. Run it against a seeded database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--user", type=int, help="User id to query as")
+        parser.add_argument(
+            "--allow",
+            action="append",
+            default=[],
+            help="Table that may be scanned sequentially",
+        )
+        parser.add_argument(
+            "--prefer-indexes",
+            action="store_true",
+            help=(
+                "Discourage sequential scans (PostgreSQL enable_seqscan) so "
+                "that small databases report the plans of large ones"
+            ),
+        )
+        parser.add_argument("--verbose-plans", action="store_true")
+
+    def recipe_filter(self, user, query):
+        request = RequestFactory().get(f"/api/recipes/?{query}")
+        request.user = user
+        return RecipeFilter(
+            data=request.GET,
+            queryset=Recipe.objects.with_user_flags(user),
+            request=request,
+        ).qs
+
+    def get_queries(self, user):
+        tags = "&".join(
+            f"tags={slug}"
+            for slug in Tag.objects.values_list("slug", flat=True)[:3]
+        )
+        ingredients = list(
+            RecipeIngredient.objects.filter(
+                recipe__shopping_cart__user=user
+            ).values_list("ingredient", flat=True)[:20]
+        ) or list(Ingredient.objects.values_list("id", flat=True)[:20])
+        return {
+            "recipe list": Recipe.objects.with_user_flags(user)[:10],
+            "recipe list by author": self.recipe_filter(
+                user, f"author={user.id}"
+            )[:10],
+            "recipe list by tags": self.recipe_filter(user, tags)[:10],
+            "favorited recipes": self.recipe_filter(
+                user, "is_favorited=1"
+            )[:10],
+            "recipes in shopping cart": self.recipe_filter(
+                user, "is_in_shopping_cart=1"
+            )[:10],
+            "subscriptions": User.objects.filter(following__user=user)
+            .annotate(follow_id=F("following__id"))
+            .order_by("-follow_id")[:10],
+            "subscription recipes": Recipe.objects.filter(
+                author__in=User.objects.filter(
+                    following__user=user
+                ).values("id")[:10]
+            ).order_by("-pub_date", "-id"),
+            "shopping list": get_user_shopping_cart(user),
+            "shopping cart totals refresh": get_live_shopping_cart_totals(
+                [user.id], ingredients
+            ),
+        }
+
+    def handle(self, *args, **options):
+        pattern = SEQUENTIAL_SCAN.get(connection.vendor)
+        if pattern is None:
+            raise CommandError(f"Unsupported database: {connection.vendor}")
+        users = User.objects.order_by("-id")
+        if options["user"]:
+            users = users.filter(id=options["user"])
+        user = users.first()
+        if user is None:
+            raise CommandError("No users to query as, seed the database")
+        allowed = SMALL_TABLES | set(options["allow"])
+        with transaction.atomic():
+            if options["prefer_indexes"] and connection.vendor == "postgresql":
+                with connection.cursor() as cursor:
+                    cursor.execute("SET LOCAL enable_seqscan = off")
+            plans = {
+                name: queryset.explain()
+                for name, queryset in self.get_queries(user).items()
+            }
+        failed = []
+        for name, plan in plans.items():
+            scanned = set(pattern.findall(plan)) - allowed
+            if options["verbose_plans"]:
+                self.stdout.write(f"{name}:\n{plan}\n")
+            if scanned:
+                failed.append(name)
+                self.stderr.write(
+                    f"{name}: sequential scan on {', '.join(sorted(scanned))}"
+                )
+        if failed:
+            raise CommandError(f"{len(failed)} query plans regressed")
+        self.stdout.write(self.style.SUCCESS("All query plans use indexes"))
@@ -0,0 +1,147 @@
+import csv
+import io
+import json
+from itertools import islice
+from pathlib import Path
+from time import monotonic
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from api.autocomplete import INGREDIENTS_VERSION_KEY
+from api.cache import bump_version
+from recipes.models import Ingredient
+
+NAME_MAX_LENGTH = Ingredient._meta.get_field("name").max_length
+UNIT_MAX_LENGTH = Ingredient._meta.get_field("measurement_unit").max_length
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(file, chunk_size=64 * 1024):
+    decoder = json.JSONDecoder()
+    buffer, position, eof = "", 0, False
+    while True:
+        while position < len(buffer) and buffer[position] in " \t\r\n[,]":
+            position += 1
+        if position == len(buffer) and eof:
+            return
+        try:
+            if position == len(buffer):
+                raise json.JSONDecodeError("Buffer is empty", buffer, position)
+            item, position = decoder.raw_decode(buffer, position)
+        except json.JSONDecodeError:
+            if eof:
+                raise CommandError("Invalid JSON in ingredients file")
+            chunk = file.read(chunk_size)
+            buffer, position, eof = buffer[position:] + chunk, 0, not chunk
+            continue
+        yield item.get("name"), item.get("measurement_unit")
+
+
+READERS = {
+    "csv": read_csv,
+    "json": read_json,
+}
+
+
+class Command(BaseCommand):
+    help = "Bulk upsert ingredients from a CSV or JSON file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", type=Path)
+        parser.add_argument("--format", choices=READERS)
+        parser.add_argument("--batch-size", type=int, default=10000)
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        file_format = options["format"] or path.suffix.lstrip(".").lower()
+        if file_format not in READERS:
+            raise CommandError(f"Unsupported file format: {file_format}")
+        if connection.vendor == "postgresql":
+            upsert = self.upsert_postgresql
+        else:
+            upsert = self.upsert
+        inserted = updated = skipped = total = 0
+        started = monotonic()
+        with open(path, encoding="utf-8", newline="") as file:
+            rows = READERS[file_format](file)
+            while batch := list(islice(rows, options["batch_size"])):
+                total += len(batch)
+                ingredients = {}
+                for name, unit in batch:
+                    name, unit = (name or "").strip(), (unit or "").strip()
+                    if (
+                        name
+                        and unit
+                        and len(name) <= NAME_MAX_LENGTH
+                        and len(unit) <= UNIT_MAX_LENGTH
+                    ):
+                        ingredients[name] = unit
+                with transaction.atomic():
+                    batch_inserted, batch_updated = upsert(ingredients)
+                inserted += batch_inserted
+                updated += batch_updated
+                skipped += len(batch) - batch_inserted - batch_updated
+        elapsed = monotonic() - started
+        if inserted or updated:
+            bump_version(INGREDIENTS_VERSION_KEY)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Inserted: {inserted}, updated: {updated}, "
+                f"skipped: {skipped} ({total / max(elapsed, 1e-9):.0f} rows/s)"
+            )
+        )
+
+    def upsert(self, ingredients):
+        existing = Ingredient.objects.filter(name__in=ingredients).only(
+            "id", "name", "measurement_unit"
+        )
+        changed = []
+        for ingredient in existing:
+            unit = ingredients.pop(ingredient.name)
+            if ingredient.measurement_unit != unit:
+                ingredient.measurement_unit = unit
+                changed.append(ingredient)
+        Ingredient.objects.bulk_update(changed, ["measurement_unit"])
+        created = Ingredient.objects.bulk_create(
+            (
+                Ingredient(name=name, measurement_unit=unit)
+                for name, unit in ingredients.items()
+            ),
+            ignore_conflicts=True,
+        )
+        return len(created), len(changed)
+
+    def upsert_postgresql(self, ingredients):
+        table = connection.ops.quote_name(Ingredient._meta.db_table)
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(ingredients.items())
+        buffer.seek(0)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "CREATE TEMPORARY TABLE IF NOT EXISTS ingredient_staging "
+                "(name varchar(200), measurement_unit varchar(200)) "
+                "ON COMMIT DELETE ROWS"
+            )
+            cursor.copy_expert(
+                "COPY ingredient_staging (name, measurement_unit) "
+                "FROM STDIN WITH (FORMAT csv)",
+                buffer,
+            )
+            cursor.execute(
+                f"INSERT INTO {table} (name, measurement_unit) "
+                "SELECT name, measurement_unit FROM ingredient_staging "
+                "ON CONFLICT (name) DO UPDATE "
+                "SET measurement_unit = EXCLUDED.measurement_unit "
+                f"WHERE {table}.measurement_unit "
+                "IS DISTINCT FROM EXCLUDED.measurement_unit "
+                "RETURNING xmax = 0"
+            )
+            results = [inserted for inserted, in cursor.fetchall()]
+        inserted = sum(results)
+        return inserted, len(results) - inserted
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+
+from api.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Generate WebP variants and thumbnails for recipe images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Reprocess images that already have a thumbnail",
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image="")
+        if not options["all"]:
+            recipes = recipes.filter(thumbnail="")
+        processed = failed = 0
+        for recipe_id, name in recipes.values_list("id", "image").iterator():
+            try:
+                process_recipe_image(recipe_id, name)
+            except (OSError, ValueError) as error:
+                failed += 1
+                self.stderr.write(f"{name}: {error}")
+            else:
+                processed += 1
+        self.stdout.write(
+            self.style.SUCCESS(f"Processed: {processed}, failed: {failed}")
+        )
@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+
+from api.services import recount_counters
+
+
+class Command(BaseCommand):
+    help = "Recalculate denormalized favorites, recipes and followers counters"
+
+    def handle(self, *args, **options):
+        for counter, repaired in recount_counters().items():
+            self.stdout.write(f"{counter}: repaired {repaired} rows")
+        self.stdout.write(self.style.SUCCESS("Counters are up to date"))
@@ -0,0 +1,65 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.seeding import SEED_BATCH_SIZE, seed_dataset
+from users.models import User
+
+DEFAULT_INGREDIENTS_FILE = (
+    settings.BASE_DIR.parent / "data" / "ingredients.csv"
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a large deterministic dataset with Zipf-like popularity "
+        "using batched inserts"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=10000)
+        parser.add_argument("--recipes", type=int, default=100000)
+        parser.add_argument("--ingredients-per-recipe", type=int, default=10)
+        parser.add_argument("--tags", type=int, default=12)
+        parser.add_argument(
+            "--follows", type=int, default=20, help="Average per user"
+        )
+        parser.add_argument(
+            "--favorites", type=int, default=30, help="Average per user"
+        )
+        parser.add_argument(
+            "--carts", type=int, default=5, help="Average per user"
+        )
+        parser.add_argument("--skew", type=float, default=1.0)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument(
+            "--ingredients-file", default=DEFAULT_INGREDIENTS_FILE
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=SEED_BATCH_SIZE
+        )
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith="seed_user_").exists():
+            raise CommandError("The database already contains seeded users")
+        created = seed_dataset(
+            users=options["users"],
+            recipes=options["recipes"],
+            ingredients_per_recipe=options["ingredients_per_recipe"],
+            tags=options["tags"],
+            follows=options["follows"],
+            favorites=options["favorites"],
+            carts=options["carts"],
+            seed=options["seed"],
+            skew=options["skew"],
+            ingredients_file=options["ingredients_file"],
+            image=True,
+            batch_size=options["batch_size"],
+            log=self.stdout.write,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                ", ".join(
+                    f"{name}: {count}" for name, count in created.items()
+                )
+            )
+        )
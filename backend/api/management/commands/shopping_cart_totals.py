@@ -0,0 +1,85 @@
+from itertools import islice
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.services import (
+    SHOPPING_CART_CHUNK_SIZE,
+    get_live_shopping_cart_totals,
+)
+from recipes.models import ShoppingCartIngredient
+
+
+class Command(BaseCommand):
+    help = "Rebuild or verify the per-user shopping cart ingredient totals"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only compare the table with the live join and report drift",
+        )
+
+    def handle(self, *args, **options):
+        if options["check"]:
+            self.check_totals()
+        else:
+            self.rebuild_totals()
+
+    def live_totals(self):
+        for total in get_live_shopping_cart_totals().iterator(
+            chunk_size=SHOPPING_CART_CHUNK_SIZE
+        ):
+            yield (total["user"], total["ingredient"], total["total_amount"])
+
+    def stored_totals(self):
+        return (
+            ShoppingCartIngredient.objects.order_by("user_id", "ingredient_id")
+            .values_list("user", "ingredient", "total_amount")
+            .iterator(chunk_size=SHOPPING_CART_CHUNK_SIZE)
+        )
+
+    def check_totals(self):
+        missing = extra = mismatched = 0
+        live, stored = self.live_totals(), self.stored_totals()
+        expected, actual = next(live, None), next(stored, None)
+        while expected is not None or actual is not None:
+            if actual is None or (
+                expected is not None and expected[:2] < actual[:2]
+            ):
+                missing += 1
+                expected = next(live, None)
+            elif expected is None or actual[:2] < expected[:2]:
+                extra += 1
+                actual = next(stored, None)
+            else:
+                if expected[2] != actual[2]:
+                    mismatched += 1
+                expected, actual = next(live, None), next(stored, None)
+        if missing or extra or mismatched:
+            raise CommandError(
+                f"Drift detected: {missing} missing, {extra} extra, "
+                f"{mismatched} mismatched rows"
+            )
+        self.stdout.write(
+            self.style.SUCCESS("Shopping cart totals are in sync")
+        )
+
+    @transaction.atomic
+    def rebuild_totals(self):
+        ShoppingCartIngredient.objects.all().delete()
+        created = 0
+        totals = self.live_totals()
+        while batch := list(islice(totals, SHOPPING_CART_CHUNK_SIZE)):
+            ShoppingCartIngredient.objects.bulk_create(
+                ShoppingCartIngredient(
+                    user_id=user,
+                    ingredient_id=ingredient,
+                    total_amount=total_amount,
+                )
+                for user, ingredient, total_amount in batch
+            )
+            created += len(batch)
+        self.stdout.write(
+            self.style.SUCCESS(f"Rebuilt {created} shopping cart totals")
+        )
@@ -0,0 +1,119 @@
+import asyncio
+import logging
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from api.performance import (
+    QueryRecorder,
+    SerializerTimer,
+    current_recorder,
+    metrics_registry,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PERFORMANCE_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        started = perf_counter()
+        token = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        return self.finish(request, response, started)
+
+    async def __acall__(self, request):
+        started = perf_counter()
+        token = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        return self.finish(request, response, started)
+
+    def start(self, request):
+        request.query_recorder = QueryRecorder()
+        request.serializer_timer = SerializerTimer()
+        request.render_time = 0.0
+        return current_recorder.set(request.query_recorder)
+
+    def finish(self, request, response, started):
+        total = perf_counter() - started
+        recorder = request.query_recorder
+        timer = request.serializer_timer
+        route = self.get_route(request)
+        if settings.PERFORMANCE_SERVER_TIMING or self.is_staff(request):
+            response["Server-Timing"] = (
+                f"db;dur={recorder.duration * 1000:.1f};"
+                f'desc="{recorder.count} queries", '
+                f"serialize;dur={timer.duration * 1000:.1f}, "
+                f"render;dur={request.render_time * 1000:.1f}, "
+                f"total;dur={total * 1000:.1f}"
+            )
+        metrics_registry.observe(
+            route,
+            request.method,
+            response.status_code,
+            total=total,
+            db_time=recorder.duration,
+            serialize=timer.duration,
+            render=request.render_time,
+            queries=recorder.count,
+        )
+        if total * 1000 >= settings.PERFORMANCE_SLOW_REQUEST_MS:
+            self.log_slow_request(request, route, recorder, total)
+        return response
+
+    def process_template_response(self, request, response):
+        if response.is_rendered:
+            return response
+        started = perf_counter()
+
+        def rendered(response):
+            request.render_time = perf_counter() - started
+
+        response.add_post_render_callback(rendered)
+        return response
+
+    def is_staff(self, request):
+        user = getattr(request, "user", None)
+        return user is not None and user.is_staff
+
+    def get_route(self, request):
+        match = getattr(request, "resolver_match", None)
+        if match is None:
+            return "unmatched"
+        return match.view_name
+
+    def log_slow_request(self, request, route, recorder, total):
+        repeated = "".join(
+            f"\n  {count}x {sql}"
+            for count, sql in recorder.repeated(
+                settings.PERFORMANCE_SLOW_REQUEST_STATEMENTS
+            )
+        )
+        logger.warning(
+            "Slow request %s %s (%s): %.1f ms, %d queries in %.1f ms%s",
+            request.method,
+            request.get_full_path(),
+            route,
+            total * 1000,
+            recorder.count,
+            recorder.duration * 1000,
+            repeated,
+        )
@@ -0,0 +1,25 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecipeChange',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('recipes', models.JSONField(null=True, verbose_name='Рецепты')),
+            ],
+            options={
+                'verbose_name': 'Изменение рецептов',
+                'verbose_name_plural': 'Изменения рецептов',
+            },
+        ),
+    ]
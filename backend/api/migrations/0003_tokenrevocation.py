@@ -0,0 +1,26 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0002_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenRevocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('user_id', models.PositiveIntegerField(verbose_name='Пользователь')),
+                ('key', models.CharField(blank=True, max_length=40, verbose_name='Токен')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='Создано')),
+            ],
+            options={
+                'verbose_name': 'Отзыв токена',
+                'verbose_name_plural': 'Отзывы токенов',
+            },
+        ),
+    ]
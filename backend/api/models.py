@@ -0,0 +1,28 @@
+from django.db import models
+
+
+class RecipeChange(models.Model):
+    recipes = models.JSONField("Рецепты", null=True)
+
+    class Meta:
+        verbose_name = "Изменение рецептов"
+        verbose_name_plural = "Изменения рецептов"
+
+
+class Version(models.Model):
+    key = models.CharField("Ключ", max_length=64, primary_key=True)
+    value = models.CharField("Версия", max_length=32)
+
+    class Meta:
+        verbose_name = "Версия данных"
+        verbose_name_plural = "Версии данных"
+
+
+class TokenRevocation(models.Model):
+    user_id = models.PositiveIntegerField("Пользователь")
+    key = models.CharField("Токен", max_length=40, blank=True)
+    created = models.DateTimeField("Создано", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "Отзыв токена"
+        verbose_name_plural = "Отзывы токенов"
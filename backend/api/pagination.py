@@ -1,8 +1,133 @@
-from rest_framework.pagination import PageNumberPagination
+import json
+from functools import reduce
+from operator import or_
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination
 
 from foodgram.settings import DEFAULT_PAGE_SIZE
 
 
+def reverse_ordering(ordering):
+    return tuple(
+        field[1:] if field.startswith("-") else f"-{field}"
+        for field in ordering
+    )
+
+
+def keyset_filter(ordering, position):
+    conditions = []
+    for index, field in enumerate(ordering):
+        name = field.lstrip("-")
+        lookup = "lt" if field.startswith("-") else "gt"
+        conditions.append(
+            Q(
+                **{
+                    previous.lstrip("-"): value
+                    for previous, value in zip(ordering[:index], position)
+                },
+                **{f"{name}__{lookup}": position[index]},
+            )
+        )
+    first = ordering[0]
+    lookup = "lte" if first.startswith("-") else "gte"
+    return Q(**{f"{first.lstrip('-')}__{lookup}": position[0]}) & reduce(
+        or_, conditions
+    )
+
+
+class LimitCursorPagination(CursorPagination):
+    page_size = DEFAULT_PAGE_SIZE
+    page_size_query_param = "limit"
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.page_size = self.get_page_size(request)
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse, position = False, None
+        if self.cursor is not None:
+            reverse, position = self.cursor.reverse, self.cursor.position
+        ordering = self.ordering
+        if reverse:
+            ordering = reverse_ordering(ordering)
+        queryset = queryset.order_by(*ordering)
+        if position is not None:
+            queryset = queryset.filter(
+                keyset_filter(ordering, self.decode_position(position))
+            )
+        results = list(queryset[: self.page_size + 1])
+        self.page = results[: self.page_size]
+        following = None
+        if len(results) > self.page_size:
+            following = self._get_position_from_instance(
+                results[-1], self.ordering
+            )
+        if reverse:
+            self.page.reverse()
+            self.next_position, self.previous_position = position, following
+        else:
+            self.next_position, self.previous_position = following, position
+        self.has_next = self.next_position is not None
+        self.has_previous = self.previous_position is not None
+        self.display_page_controls = self.has_next or self.has_previous
+        return self.page
+
+    def decode_position(self, position):
+        try:
+            values = json.loads(position)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values
+
+    def _get_position_from_instance(self, instance, ordering):
+        return json.dumps(
+            [
+                str(
+                    instance[field.lstrip("-")]
+                    if isinstance(instance, dict)
+                    else getattr(instance, field.lstrip("-"))
+                )
+                for field in ordering
+            ]
+        )
+
+
 class PageLimitPagination(PageNumberPagination):
     page_size = DEFAULT_PAGE_SIZE
     page_size_query_param = "limit"
+    cursor_ordering = None
+    cursor_paginator = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        cursor_param = LimitCursorPagination.cursor_query_param
+        if self.cursor_ordering and cursor_param in request.query_params:
+            self.cursor_paginator = LimitCursorPagination(self.cursor_ordering)
+            return self.cursor_paginator.paginate_queryset(
+                queryset, request, view
+            )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+
+class RecipePagination(PageLimitPagination):
+    cursor_ordering = ("-pub_date", "-id")
+
+
+class SubscriptionPagination(PageLimitPagination):
+    cursor_ordering = ("-follow_id",)
+
+
+class FeedPagination(LimitCursorPagination):
+    ordering = ("-pub_date", "-id")
@@ -0,0 +1,258 @@
+from array import array
+from bisect import bisect_left
+from collections import namedtuple
+from functools import reduce
+from operator import and_, or_
+from threading import Lock
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+
+from api.models import RecipeChange
+from recipes.models import Recipe, RecipeIngredient
+
+DENSE_POSTING_RATIO = 64
+
+PantryMatch = namedtuple("PantryMatch", ("recipe", "matched", "missing"))
+
+
+def get_pantry_version():
+    return (
+        RecipeChange.objects.order_by("-id")
+        .values_list("id", flat=True)
+        .first()
+        or 0
+    )
+
+
+@transaction.atomic
+def publish_recipe_changes(recipe_ids=None):
+    changes = None if recipe_ids is None else list(recipe_ids)
+    RecipeChange.objects.select_for_update().order_by("-id").first()
+    change = RecipeChange.objects.create(recipes=changes)
+    if change.id % settings.PANTRY_MAX_PENDING_CHANGES == 0:
+        RecipeChange.objects.filter(
+            id__lte=change.id - settings.PANTRY_MAX_PENDING_CHANGES
+        ).delete()
+
+
+def to_bitmap(recipe_ids, size):
+    bits = bytearray(size // 8 + 1)
+    for recipe in recipe_ids:
+        bits[recipe >> 3] |= 1 << (recipe & 7)
+    return int.from_bytes(bits, "little")
+
+
+def highest_bits(bits, skip, limit):
+    if skip:
+        low, high = 0, bits.bit_length()
+        while low < high:
+            middle = (low + high) // 2
+            if (bits >> middle).bit_count() > skip:
+                low = middle + 1
+            else:
+                high = middle
+        bits &= (1 << low) - 1
+    found = []
+    while bits and len(found) < limit:
+        position = bits.bit_length() - 1
+        found.append(position)
+        bits &= (1 << position) - 1
+    return found
+
+
+def add_to_counter(planes, bits):
+    for level, plane in enumerate(planes):
+        planes[level], bits = plane ^ bits, plane & bits
+        if not bits:
+            return
+    planes.append(bits)
+
+
+def counted_exactly(bits, planes, count):
+    if count >> len(planes):
+        return 0
+    for level, plane in enumerate(planes):
+        if not bits:
+            break
+        bits &= plane if count >> level & 1 else ~plane
+    return bits
+
+
+class PantryResult:
+    def __init__(self, groups):
+        self.groups = groups
+        self.total = sum(count for _, _, _, count in groups)
+
+    def __len__(self):
+        return self.total
+
+    def __getitem__(self, items):
+        start, stop, _ = items.indices(self.total)
+        found = []
+        for bits, matched, missing, count in self.groups:
+            if stop <= 0:
+                break
+            if start < count:
+                found.extend(
+                    PantryMatch(recipe, matched, missing)
+                    for recipe in highest_bits(
+                        bits, start, min(stop, count) - start
+                    )
+                )
+                start = count
+            start -= count
+            stop -= count
+        return found
+
+
+class PantryIndex:
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._postings = {}
+        self._sizes = {}
+        self._tags = {}
+
+    def _load(self, version):
+        size = Recipe.objects.aggregate(size=Max("id"))["size"] or 0
+        counts = array("H", bytes(2 * (size + 1)))
+        postings = {}
+        for recipe, ingredient in (
+            RecipeIngredient.objects.order_by()
+            .values_list("recipe", "ingredient")
+            .iterator(chunk_size=10000)
+        ):
+            if recipe >= len(counts):
+                counts.frombytes(bytes(2 * (recipe + 1 - len(counts))))
+            counts[recipe] += 1
+            postings.setdefault(ingredient, array("q")).append(recipe)
+        size = len(counts) - 1
+        for ingredient, posting in postings.items():
+            if len(posting) * DENSE_POSTING_RATIO > size:
+                postings[ingredient] = to_bitmap(posting, size)
+            else:
+                postings[ingredient] = array("q", sorted(posting))
+        sizes = {}
+        for recipe, count in enumerate(counts):
+            if count:
+                sizes.setdefault(count, array("q")).append(recipe)
+        tags = {}
+        for recipe, tag in (
+            Recipe.tags.through.objects.order_by()
+            .values_list("recipe", "tag")
+            .iterator(chunk_size=10000)
+        ):
+            tags.setdefault(tag, array("q")).append(recipe)
+        self._postings, self._sizes, self._tags, self._version = (
+            postings,
+            {
+                count: to_bitmap(recipes, size)
+                for count, recipes in sizes.items()
+            },
+            {tag: to_bitmap(recipes, size) for tag, recipes in tags.items()},
+            version,
+        )
+
+    def _discard(self, recipe):
+        bit = 1 << recipe
+        for mapping in (self._postings, self._sizes, self._tags):
+            for key, value in mapping.items():
+                if isinstance(value, int):
+                    if value & bit:
+                        mapping[key] = value ^ bit
+                    continue
+                position = bisect_left(value, recipe)
+                if position < len(value) and value[position] == recipe:
+                    mapping[key] = value[:position] + value[position + 1:]
+
+    def _apply(self, recipe_ids):
+        ingredients = {}
+        for recipe, ingredient in RecipeIngredient.objects.filter(
+            recipe__in=recipe_ids
+        ).values_list("recipe", "ingredient"):
+            ingredients.setdefault(recipe, []).append(ingredient)
+        tags = list(
+            Recipe.tags.through.objects.filter(
+                recipe__in=recipe_ids
+            ).values_list("recipe", "tag")
+        )
+        for recipe in recipe_ids:
+            self._discard(recipe)
+        for recipe, items in ingredients.items():
+            bit = 1 << recipe
+            for ingredient in items:
+                posting = self._postings.get(ingredient, array("q"))
+                if isinstance(posting, int):
+                    self._postings[ingredient] = posting | bit
+                    continue
+                position = bisect_left(posting, recipe)
+                self._postings[ingredient] = (
+                    posting[:position]
+                    + array("q", [recipe])
+                    + posting[position:]
+                )
+            self._sizes[len(items)] = self._sizes.get(len(items), 0) | bit
+        for recipe, tag in tags:
+            self._tags[tag] = self._tags.get(tag, 0) | (1 << recipe)
+
+    def _update(self, version):
+        changes = None
+        pending = version - (self._version or version)
+        if 0 < pending <= settings.PANTRY_MAX_PENDING_CHANGES:
+            found = list(
+                RecipeChange.objects.filter(
+                    id__gt=self._version, id__lte=version
+                ).values_list("recipes", flat=True)
+            )
+            if len(found) == pending and None not in found:
+                changes = set().union(*found)
+        if (
+            changes is None
+            or len(changes) > settings.PANTRY_MAX_PENDING_CHANGES
+        ):
+            self._load(version)
+            return
+        self._apply(sorted(changes))
+        self._version = version
+
+    def _refresh(self):
+        version = get_pantry_version()
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._update(version)
+        return self._postings, self._sizes, self._tags
+
+    def search(self, ingredients, missing=0, tags=(), all_tags=False):
+        postings, sizes, tagged = self._refresh()
+        found = 0
+        planes = []
+        used = 0
+        for ingredient in set(ingredients):
+            posting = postings.get(ingredient)
+            if not posting:
+                continue
+            if not isinstance(posting, int):
+                posting = to_bitmap(posting, posting[-1])
+            found |= posting
+            add_to_counter(planes, posting)
+            used += 1
+        if tags:
+            found &= reduce(
+                and_ if all_tags else or_,
+                (tagged.get(tag, 0) for tag in tags),
+            )
+        groups = []
+        for lacking in range(missing + 1):
+            for matched in range(used, 0, -1):
+                bits = counted_exactly(
+                    found & sizes.get(matched + lacking, 0), planes, matched
+                )
+                if bits:
+                    groups.append((bits, matched, lacking, bits.bit_count()))
+        return PantryResult(groups)
+
+
+pantry_index = PantryIndex()
@@ -0,0 +1,386 @@
+import struct
+import zlib
+from functools import cached_property
+from pathlib import Path
+
+PAGE_WIDTH = 595
+PAGE_HEIGHT = 842
+MARGIN = 50
+FONT_SIZE = 11
+LEADING = 14
+LINES_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN) // LEADING
+CATALOG, PAGES, FONT = 1, 2, 3
+SUBSET_TABLES = (
+    "cmap",
+    "cvt ",
+    "fpgm",
+    "glyf",
+    "head",
+    "hhea",
+    "hmtx",
+    "loca",
+    "maxp",
+    "prep",
+)
+COMPOSITE_WORDS, COMPOSITE_SCALE, COMPOSITE_MORE = 0x1, 0x8, 0x20
+COMPOSITE_XY_SCALE, COMPOSITE_MATRIX = 0x40, 0x80
+
+
+def table_checksum(data):
+    return sum(struct.unpack(f">{len(data) // 4}I", data)) & 0xFFFFFFFF
+
+
+def build_font(tables):
+    count = len(tables)
+    power = 2 ** (count.bit_length() - 1)
+    header = struct.pack(
+        ">IHHHH",
+        0x00010000,
+        count,
+        16 * power,
+        power.bit_length() - 1,
+        16 * (count - power),
+    )
+    offset = len(header) + 16 * count
+    directory, body = [], []
+    head = None
+    for tag, data in sorted(tables.items()):
+        if tag == "head":
+            head = offset
+        padded = bytes(data) + bytes(-len(data) % 4)
+        directory.append(
+            struct.pack(
+                ">4sIII",
+                tag.encode("latin-1"),
+                table_checksum(padded),
+                offset,
+                len(data),
+            )
+        )
+        body.append(padded)
+        offset += len(padded)
+    font = bytearray(header + b"".join(directory) + b"".join(body))
+    if head is not None:
+        struct.pack_into(
+            ">I", font, head + 8, (0xB1B0AFBA - table_checksum(font)) % 2**32
+        )
+    return bytes(font)
+
+
+def subset_tag(glyphs):
+    value = zlib.crc32(b",".join(b"%d" % glyph for glyph in sorted(glyphs)))
+    letters = []
+    for _ in range(6):
+        value, letter = divmod(value, 26)
+        letters.append(chr(ord("A") + letter))
+    return "".join(letters)
+
+
+class TrueTypeFont:
+    def __init__(self, path):
+        self.path = Path(path)
+        self.data = self.path.read_bytes()
+        count = struct.unpack_from(">H", self.data, 4)[0]
+        self.tables = {}
+        for index in range(count):
+            tag, _, offset, length = struct.unpack_from(
+                ">4sIII", self.data, 12 + 16 * index
+            )
+            self.tables[tag.decode("latin-1")] = (offset, length)
+        head = self.tables["head"][0]
+        self.units_per_em = struct.unpack_from(">H", self.data, head + 18)[0]
+        self.bbox = [
+            self.scale(value)
+            for value in struct.unpack_from(">4h", self.data, head + 36)
+        ]
+        hhea = self.tables["hhea"][0]
+        ascent, descent = struct.unpack_from(">hh", self.data, hhea + 4)
+        self.ascent, self.descent = self.scale(ascent), self.scale(descent)
+        metrics = struct.unpack_from(">H", self.data, hhea + 34)[0]
+        hmtx = self.tables["hmtx"][0]
+        self.advances = [
+            struct.unpack_from(">H", self.data, hmtx + 4 * index)[0]
+            for index in range(metrics)
+        ]
+        self.glyphs = self.read_cmap()
+
+    @property
+    def name(self):
+        return "".join(char for char in self.path.stem if char.isalnum())
+
+    def table(self, tag):
+        offset, length = self.tables[tag]
+        return self.data[offset:offset + length]
+
+    @cached_property
+    def glyph_offsets(self):
+        head, maxp = self.tables["head"][0], self.tables["maxp"][0]
+        long_offsets = struct.unpack_from(">h", self.data, head + 50)[0]
+        count = struct.unpack_from(">H", self.data, maxp + 4)[0] + 1
+        loca = self.tables["loca"][0]
+        if long_offsets:
+            return struct.unpack_from(f">{count}I", self.data, loca)
+        return [
+            2 * offset
+            for offset in struct.unpack_from(f">{count}H", self.data, loca)
+        ]
+
+    def glyph_data(self, glyph):
+        glyf = self.tables["glyf"][0]
+        start, end = self.glyph_offsets[glyph:glyph + 2]
+        return self.data[glyf + start:glyf + end]
+
+    def components(self, glyph):
+        data = self.glyph_data(glyph)
+        if len(data) < 10 or struct.unpack_from(">h", data)[0] >= 0:
+            return
+        position = 10
+        flags = COMPOSITE_MORE
+        while flags & COMPOSITE_MORE:
+            flags, component = struct.unpack_from(">HH", data, position)
+            yield component
+            position += 8 if flags & COMPOSITE_WORDS else 6
+            if flags & COMPOSITE_SCALE:
+                position += 2
+            elif flags & COMPOSITE_XY_SCALE:
+                position += 4
+            elif flags & COMPOSITE_MATRIX:
+                position += 8
+
+    def subset(self, glyphs):
+        keep = set()
+        pending = {0, *glyphs}
+        while pending:
+            glyph = pending.pop()
+            if glyph not in keep and glyph < len(self.glyph_offsets) - 1:
+                keep.add(glyph)
+                pending.update(self.components(glyph))
+        glyf = bytearray()
+        loca = []
+        for glyph in range(len(self.glyph_offsets) - 1):
+            loca.append(len(glyf))
+            if glyph in keep:
+                glyf += self.glyph_data(glyph)
+                glyf += bytes(-len(glyf) % 4)
+        loca.append(len(glyf))
+        head = bytearray(self.table("head"))
+        struct.pack_into(">I", head, 8, 0)
+        struct.pack_into(">h", head, 50, 1)
+        tables = {
+            tag: self.table(tag) for tag in SUBSET_TABLES if tag in self.tables
+        }
+        tables.update(
+            head=head,
+            loca=struct.pack(f">{len(loca)}I", *loca),
+            glyf=glyf,
+        )
+        return build_font(tables)
+
+    def scale(self, value):
+        return round(value * 1000 / self.units_per_em)
+
+    def width(self, glyph):
+        return self.scale(self.advances[min(glyph, len(self.advances) - 1)])
+
+    def read_cmap(self):
+        cmap = self.tables["cmap"][0]
+        count = struct.unpack_from(">H", self.data, cmap + 2)[0]
+        for index in range(count):
+            platform, encoding, offset = struct.unpack_from(
+                ">HHI", self.data, cmap + 4 + 8 * index
+            )
+            table = cmap + offset
+            if (platform, encoding) in ((3, 1), (0, 3)) and (
+                struct.unpack_from(">H", self.data, table)[0] == 4
+            ):
+                return self.read_cmap_format_4(table)
+        raise ValueError(f"{self.path} has no Unicode BMP cmap")
+
+    def read_cmap_format_4(self, table):
+        segments = struct.unpack_from(">H", self.data, table + 6)[0] // 2
+        ends = table + 14
+        starts = ends + 2 * segments + 2
+        deltas = starts + 2 * segments
+        range_offsets = deltas + 2 * segments
+        glyphs = {}
+        for segment in range(segments):
+            end, start, delta, range_offset = (
+                struct.unpack_from(">H", self.data, array + 2 * segment)[0]
+                for array in (ends, starts, deltas, range_offsets)
+            )
+            for code in range(start, min(end, 0xFFFE) + 1):
+                if range_offset:
+                    glyph = struct.unpack_from(
+                        ">H",
+                        self.data,
+                        range_offsets
+                        + 2 * segment
+                        + range_offset
+                        + 2 * (code - start),
+                    )[0]
+                    if not glyph:
+                        continue
+                else:
+                    glyph = code
+                glyphs[chr(code)] = (glyph + delta) & 0xFFFF
+        return glyphs
+
+
+def pdf_object(number, body, stream=None):
+    if stream is None:
+        return b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    return b"%d 0 obj\n%s\nstream\n%s\nendstream\nendobj\n" % (
+        number,
+        body[:-2] + b" /Length %d >>" % len(stream),
+        stream,
+    )
+
+
+def to_unicode_cmap(used):
+    glyphs = sorted(used.items())
+    blocks = [
+        b"%d beginbfchar\n%s\nendbfchar"
+        % (
+            len(block),
+            b"\n".join(
+                b"<%04X> <%s>"
+                % (glyph, char.encode("utf-16-be").hex().upper().encode())
+                for glyph, char in block
+            ),
+        )
+        for block in (
+            glyphs[start:start + 100] for start in range(0, len(glyphs), 100)
+        )
+    ]
+    return b"\n".join(
+        [
+            b"/CIDInit /ProcSet findresource begin",
+            b"12 dict begin",
+            b"begincmap",
+            b"/CIDSystemInfo << /Registry (Adobe) /Ordering (UCS) "
+            b"/Supplement 0 >> def",
+            b"/CMapName /Adobe-Identity-UCS def",
+            b"/CMapType 2 def",
+            b"1 begincodespacerange\n<0000> <FFFF>\nendcodespacerange",
+            *blocks,
+            b"endcmap",
+            b"CMapName currentdict /CMap defineresource pop",
+            b"end",
+            b"end",
+        ]
+    )
+
+
+def write_pdf(lines, font, title=""):
+    offsets = {}
+    position = 0
+    used = {}
+    pages = []
+    number = FONT + 5
+
+    def emit(object_number, body, stream=None):
+        nonlocal position
+        chunk = pdf_object(object_number, body, stream)
+        offsets[object_number] = position
+        position += len(chunk)
+        return chunk
+
+    def encode(text):
+        glyphs = []
+        for char in text:
+            glyph = font.glyphs.get(char, 0)
+            used.setdefault(glyph, char)
+            glyphs.append(b"%04X" % glyph)
+        return b"<%s>" % b"".join(glyphs)
+
+    def render_page(page_lines):
+        nonlocal number
+        content = b"BT /F1 %d Tf %d TL %d %d Td\n%s\nET" % (
+            FONT_SIZE,
+            LEADING,
+            MARGIN,
+            PAGE_HEIGHT - MARGIN - FONT_SIZE,
+            b"\n".join(encode(line) + b" Tj T*" for line in page_lines),
+        )
+        content_number, page_number = number, number + 1
+        number += 2
+        pages.append(page_number)
+        return emit(
+            content_number,
+            b"<< /Filter /FlateDecode >>",
+            zlib.compress(content),
+        ) + emit(
+            page_number,
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] "
+            b"/Resources << /Font << /F1 %d 0 R >> >> /Contents %d 0 R >>"
+            % (PAGES, PAGE_WIDTH, PAGE_HEIGHT, FONT, content_number),
+        )
+
+    header = b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n"
+    position = len(header)
+    yield header
+    page_lines = [title, ""] if title else []
+    for line in lines:
+        page_lines.append(line)
+        if len(page_lines) == LINES_PER_PAGE:
+            yield render_page(page_lines)
+            page_lines = []
+    if page_lines or not pages:
+        yield render_page(page_lines)
+
+    cid_font, descriptor, font_file, to_unicode = range(FONT + 1, FONT + 5)
+    name = f"{subset_tag(used)}+{font.name}".encode()
+    font_data = font.subset(used)
+    widths = b" ".join(
+        b"%d [%d]" % (glyph, font.width(glyph)) for glyph in sorted(used)
+    )
+    yield emit(
+        FONT,
+        b"<< /Type /Font /Subtype /Type0 /BaseFont /%s "
+        b"/Encoding /Identity-H /DescendantFonts [%d 0 R] "
+        b"/ToUnicode %d 0 R >>" % (name, cid_font, to_unicode),
+    )
+    yield emit(
+        cid_font,
+        b"<< /Type /Font /Subtype /CIDFontType2 /BaseFont /%s "
+        b"/CIDSystemInfo << /Registry (Adobe) /Ordering (Identity) "
+        b"/Supplement 0 >> /FontDescriptor %d 0 R /CIDToGIDMap /Identity "
+        b"/W [%s] >>" % (name, descriptor, widths),
+    )
+    yield emit(
+        descriptor,
+        b"<< /Type /FontDescriptor /FontName /%s /Flags 32 "
+        b"/FontBBox [%d %d %d %d] /ItalicAngle 0 /Ascent %d /Descent %d "
+        b"/CapHeight %d /StemV 80 /FontFile2 %d 0 R >>"
+        % (
+            name,
+            *font.bbox,
+            font.ascent,
+            font.descent,
+            font.ascent,
+            font_file,
+        ),
+    )
+    yield emit(
+        font_file,
+        b"<< /Filter /FlateDecode /Length1 %d >>" % len(font_data),
+        zlib.compress(font_data),
+    )
+    yield emit(to_unicode, b"<< >>", to_unicode_cmap(used))
+    yield emit(
+        PAGES,
+        b"<< /Type /Pages /Kids [%s] /Count %d >>"
+        % (b" ".join(b"%d 0 R" % page for page in pages), len(pages)),
+    )
+    yield emit(CATALOG, b"<< /Type /Catalog /Pages %d 0 R >>" % PAGES)
+    yield b"xref\n0 %d\n0000000000 65535 f \n%s" % (
+        number,
+        b"".join(
+            b"%010d 00000 n \n" % offsets[index] for index in range(1, number)
+        ),
+    )
+    yield b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        number,
+        CATALOG,
+        position,
+    )
@@ -0,0 +1,156 @@
+from bisect import bisect_left
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 250)
+HISTOGRAMS = (
+    (
+        "foodgram_request_duration_seconds",
+        "Total time spent handling the request",
+        "total",
+        DURATION_BUCKETS,
+    ),
+    (
+        "foodgram_request_db_seconds",
+        "Time spent executing SQL while handling the request",
+        "db_time",
+        DURATION_BUCKETS,
+    ),
+    (
+        "foodgram_request_serialize_seconds",
+        "Time spent in serializer.data, including the SQL it triggers",
+        "serialize",
+        DURATION_BUCKETS,
+    ),
+    (
+        "foodgram_request_render_seconds",
+        "Time spent rendering the response body",
+        "render",
+        DURATION_BUCKETS,
+    ),
+    (
+        "foodgram_request_queries",
+        "Number of SQL queries executed while handling the request",
+        "queries",
+        QUERY_BUCKETS,
+    ),
+)
+
+
+current_recorder = ContextVar("current_recorder", default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    recorder = current_recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += perf_counter() - started
+            self.count += 1
+            self.statements[sql] += 1
+
+    def repeated(self, limit):
+        return [
+            (count, sql)
+            for sql, count in self.statements.most_common(limit)
+            if count > 1
+        ]
+
+
+class SerializerTimer:
+    def __init__(self):
+        self.duration = 0.0
+        self._depth = 0
+
+    @contextmanager
+    def measure(self):
+        self._depth += 1
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if not self._depth:
+                self.duration += perf_counter() - started
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = Lock()
+        self._histograms = defaultdict(dict)
+        self._requests = Counter()
+
+    def observe(self, route, method, status, **values):
+        labels = (route, method)
+        with self._lock:
+            self._requests[(route, method, status)] += 1
+            for name, _, key, buckets in HISTOGRAMS:
+                histogram = self._histograms[name].get(labels)
+                if histogram is None:
+                    histogram = self._histograms[name][labels] = Histogram(
+                        buckets
+                    )
+                histogram.observe(values[key])
+
+    def render(self):
+        lines = [
+            "# HELP foodgram_requests_total Handled requests",
+            "# TYPE foodgram_requests_total counter",
+        ]
+        with self._lock:
+            for (route, method, status), count in sorted(
+                self._requests.items()
+            ):
+                lines.append(
+                    f'foodgram_requests_total{{route="{route}",'
+                    f'method="{method}",status="{status}"}} {count}'
+                )
+            for name, description, _, buckets in HISTOGRAMS:
+                lines.append(f"# HELP {name} {description}")
+                lines.append(f"# TYPE {name} histogram")
+                for (route, method), histogram in sorted(
+                    self._histograms[name].items()
+                ):
+                    labels = f'route="{route}",method="{method}"'
+                    total = 0
+                    for bucket, count in zip(
+                        (*buckets, "+Inf"), histogram.counts
+                    ):
+                        total += count
+                        lines.append(
+                            f'{name}_bucket{{{labels},le="{bucket}"}} {total}'
+                        )
+                    lines.append(f"{name}_sum{{{labels}}} {histogram.sum}")
+                    lines.append(f"{name}_count{{{labels}}} {total}")
+        return "\n".join(lines) + "\n"
+
+
+metrics_registry = MetricsRegistry()
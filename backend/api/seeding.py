@@ -0,0 +1,254 @@
+from array import array
+from io import BytesIO, StringIO
+from math import gcd
+from random import Random
+from time import monotonic
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, transaction
+from PIL import Image
+
+from api.autocomplete import INGREDIENTS_VERSION_KEY
+from api.cache import bump_version
+from api.pantry import publish_recipe_changes
+from api.services import insert_rows, recount_counters
+from api.tags import TAGS_VERSION_KEY
+from recipes.models import (
+    FavoriteRecipes,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    Tag,
+)
+from users.models import Follow
+
+User = get_user_model()
+
+SEED_BATCH_SIZE = 5000
+SEED_PASSWORD = "seed-password"
+SEED_IMAGE = "recipe_images/seed.png"
+
+
+def placeholder_image():
+    if not default_storage.exists(SEED_IMAGE):
+        buffer = BytesIO()
+        Image.new(
+            "RGB", settings.RECIPE_THUMBNAIL_SIZE, (235, 235, 235)
+        ).save(buffer, "PNG")
+        default_storage.save(SEED_IMAGE, ContentFile(buffer.getvalue()))
+    return SEED_IMAGE
+
+
+def zipf_rank(rng, size, skew):
+    if skew <= 0:
+        return rng.randrange(size)
+    if skew == 1:
+        rank = (size + 1) ** rng.random()
+    else:
+        power = 1 - skew
+        rank = (((size + 1) ** power - 1) * rng.random() + 1) ** (1 / power)
+    return min(int(rank) - 1, size - 1)
+
+
+class Popularity:
+    def __init__(self, ids, skew):
+        self.ids = ids
+        self.skew = skew
+        size = len(ids)
+        self.stride = max(1, int(size * 0.618))
+        while gcd(self.stride, size) != 1:
+            self.stride += 1
+
+    def pick(self, rng):
+        size = len(self.ids)
+        return self.ids[zipf_rank(rng, size, self.skew) * self.stride % size]
+
+    def sample(self, rng, count, exclude=None):
+        available = len(self.ids) - (exclude is not None)
+        count = min(count, available)
+        picked = set()
+        attempts = count * 20
+        while len(picked) < count and attempts:
+            item = self.pick(rng)
+            if item != exclude:
+                picked.add(item)
+            attempts -= 1
+        while len(picked) < count:
+            item = self.ids[rng.randrange(len(self.ids))]
+            if item != exclude:
+                picked.add(item)
+        return sorted(picked)
+
+
+def create_returning_ids(model, objects):
+    created = model.objects.bulk_create(objects)
+    if connection.features.can_return_rows_from_bulk_insert:
+        return [obj.pk for obj in created]
+    return sorted(
+        model.objects.order_by("-pk").values_list("pk", flat=True)[
+            : len(created)
+        ]
+    )
+
+
+def load_ingredients(path, count):
+    if path is not None:
+        call_command("load_ingredients", path, stdout=StringIO())
+    else:
+        insert_rows(
+            Ingredient,
+            ("name", "measurement_unit"),
+            ((f"Seed ingredient {i}", "г") for i in range(count)),
+        )
+    return array(
+        "q", Ingredient.objects.order_by("id").values_list("id", flat=True)
+    )
+
+
+@transaction.atomic
+def seed_dataset(
+    users=100,
+    recipes=1000,
+    ingredients=200,
+    ingredients_per_recipe=6,
+    tags=6,
+    follows=5,
+    favorites=10,
+    carts=3,
+    seed=0,
+    skew=1.0,
+    ingredients_file=None,
+    image=False,
+    batch_size=SEED_BATCH_SIZE,
+    log=None,
+):
+    rng = Random(seed)
+    started = monotonic()
+
+    def progress(message):
+        if log is not None:
+            log(f"[{monotonic() - started:7.1f}s] {message}")
+
+    recipe_image = placeholder_image() if image else SEED_IMAGE
+    password = make_password(SEED_PASSWORD)
+    user_ids = array("q")
+    for first in range(0, users, batch_size):
+        user_ids.extend(
+            create_returning_ids(
+                User,
+                [
+                    User(
+                        username=f"seed_user_{i}",
+                        email=f"seed_user_{i}@example.com",
+                        first_name=f"User {i}",
+                        last_name="Seed",
+                        password=password,
+                    )
+                    for i in range(first, min(first + batch_size, users))
+                ],
+            )
+        )
+    progress(f"{len(user_ids)} users")
+    tag_ids = create_returning_ids(
+        Tag,
+        [
+            Tag(
+                name=f"Seed tag {i}",
+                color=f"#{i:06X}",
+                slug=f"seed-tag-{i}",
+            )
+            for i in range(tags)
+        ],
+    )
+    ingredient_ids = load_ingredients(ingredients_file, ingredients)
+    progress(f"{len(tag_ids)} tags, {len(ingredient_ids)} ingredients")
+
+    authors = Popularity(user_ids, skew)
+    tag_popularity = Popularity(tag_ids, skew)
+    ingredient_popularity = Popularity(ingredient_ids, skew)
+    recipe_ids = array("q")
+    ingredient_rows = 0
+    for first in range(0, recipes, batch_size):
+        batch_ids = create_returning_ids(
+            Recipe,
+            [
+                Recipe(
+                    author_id=authors.pick(rng),
+                    name=f"Seed recipe {i}",
+                    image=recipe_image,
+                    thumbnail=recipe_image,
+                    text=f"Seed recipe {i} description",
+                    cooking_time=rng.randint(1, 180),
+                )
+                for i in range(first, min(first + batch_size, recipes))
+            ],
+        )
+        recipe_ids.extend(batch_ids)
+        insert_rows(
+            Recipe.tags.through,
+            ("recipe", "tag"),
+            (
+                (recipe, tag)
+                for recipe in batch_ids
+                for tag in tag_popularity.sample(rng, rng.randint(1, 3))
+            ),
+            batch_size,
+        )
+        ingredient_rows += insert_rows(
+            RecipeIngredient,
+            ("recipe", "ingredient", "amount"),
+            (
+                (recipe, ingredient, rng.randint(1, 500))
+                for recipe in batch_ids
+                for ingredient in ingredient_popularity.sample(
+                    rng, ingredients_per_recipe
+                )
+            ),
+            batch_size,
+        )
+        progress(
+            f"{len(recipe_ids)} recipes, {ingredient_rows} recipe ingredients"
+        )
+
+    recipe_popularity = Popularity(recipe_ids, skew)
+    for model, fields, targets, per_user in (
+        (Follow, ("user", "author"), authors, follows),
+        (FavoriteRecipes, ("user", "recipe"), recipe_popularity, favorites),
+        (ShoppingCart, ("user", "recipe"), recipe_popularity, carts),
+    ):
+        created = insert_rows(
+            model,
+            fields,
+            (
+                (user, target)
+                for user in user_ids
+                for target in targets.sample(
+                    rng,
+                    rng.randint(0, 2 * per_user),
+                    exclude=user if model is Follow else None,
+                )
+            ),
+            batch_size,
+        )
+        progress(f"{created} {model._meta.verbose_name_plural}")
+
+    recount_counters()
+    call_command("shopping_cart_totals", stdout=StringIO())
+    Recipe.objects.filter(image=recipe_image).update_search_vector()
+    bump_version(TAGS_VERSION_KEY)
+    bump_version(INGREDIENTS_VERSION_KEY)
+    transaction.on_commit(publish_recipe_changes)
+    progress("counters, cart totals and search vectors")
+    return {
+        "users": len(user_ids),
+        "tags": len(tag_ids),
+        "ingredients": len(ingredient_ids),
+        "recipes": len(recipe_ids),
+        "recipe_ingredients": ingredient_rows,
+    }
@@ -1,5 +1,7 @@
 from base64 import b64decode
+from binascii import Error as BinasciiError
 
+from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.core.files.base import ContentFile
 from django.db import transaction
@@ -7,16 +9,39 @@ from django.db.models import F
 from djoser.serializers import (UserCreateSerializer, UserSerializer,
                                 ValidationError)
 from rest_framework.fields import SerializerMethodField
-from rest_framework.serializers import (ImageField, IntegerField,
-                                        ModelSerializer,
+from rest_framework.serializers import (CharField, ChoiceField, ImageField,
+                                        IntegerField, ListField,
+                                        ListSerializer, ModelSerializer,
                                         PrimaryKeyRelatedField, Serializer)
 
+from api.filters import TAGS_MODE_ALL, TAGS_MODE_ANY
+from api.images import discard_image_variants, schedule_image_processing
+from api.services import refresh_shopping_cart_totals
+from api.similarity import refresh_similar_recipes
+from api.tags import tag_cache
 from recipes.models import Ingredient, Recipe, RecipeIngredient, Tag
 from users.models import Follow
 
 User = get_user_model()
 
 
+class TimedSerializerMixin:
+    @property
+    def data(self):
+        request = self.context.get("request")
+        timer = getattr(
+            getattr(request, "_request", request), "serializer_timer", None
+        )
+        if timer is None:
+            return super().data
+        with timer.measure():
+            return super().data
+
+
+class TimedListSerializer(TimedSerializerMixin, ListSerializer):
+    pass
+
+
 class UsersCreateSerializerForDjoser(UserCreateSerializer):
     class Meta:
         model = User
@@ -38,11 +63,12 @@ class UsersCreateSerializerForDjoser(UserCreateSerializer):
         return username
 
 
-class FoodgramUserSerializer(UserSerializer):
+class FoodgramUserSerializer(TimedSerializerMixin, UserSerializer):
     is_subscribed = SerializerMethodField(read_only=True)
 
     class Meta:
         model = User
+        list_serializer_class = TimedListSerializer
         fields = [
             "email",
             "id",
@@ -50,11 +76,15 @@ class FoodgramUserSerializer(UserSerializer):
             "first_name",
             "last_name",
             "is_subscribed",
+            "recipes_count",
+            "followers_count",
             "password",
         ]
         extra_kwargs = {"password": {"write_only": True}}
 
     def get_is_subscribed(self, object):
+        if hasattr(object, "is_subscribed"):
+            return object.is_subscribed
         user = self.context.get("request").user
         if user.is_anonymous:
             return False
@@ -64,56 +94,76 @@ class FoodgramUserSerializer(UserSerializer):
 class Base64ImageField(ImageField):
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith("data:image"):
-            format, imgstr = data.split(";base64,")
+            format, _, imgstr = data.partition(";base64,")
+            if len(imgstr) * 3 // 4 > settings.RECIPE_IMAGE_MAX_SIZE:
+                raise ValidationError("Картинка слишком большая")
+            try:
+                content = b64decode(imgstr, validate=True)
+            except BinasciiError:
+                self.fail("invalid")
             ext = format.split("/")[-1]
-            data = ContentFile(b64decode(imgstr), name="photo." + ext)
+            data = ContentFile(content, name="photo." + ext)
         return super().to_internal_value(data)
 
 
-class PreviewRecipeSerializer(ModelSerializer):
+class ImageThumbnailMixin:
+    def get_image_thumbnail(self, recipe):
+        image = recipe.thumbnail or recipe.image
+        if not image:
+            return None
+        request = self.context.get("request")
+        if request is not None:
+            return request.build_absolute_uri(image.url)
+        return image.url
+
+
+class PreviewRecipeSerializer(
+    TimedSerializerMixin, ImageThumbnailMixin, ModelSerializer
+):
     image = Base64ImageField()
+    image_thumbnail = SerializerMethodField()
 
     class Meta:
         model = Recipe
-        fields = ["id", "name", "image", "cooking_time"]
+        list_serializer_class = TimedListSerializer
+        fields = ["id", "name", "image", "image_thumbnail", "cooking_time"]
 
 
 class FollowSerializer(FoodgramUserSerializer):
     recipes = PreviewRecipeSerializer(many=True, read_only=True)
-    recipes_count = SerializerMethodField()
 
     class Meta(FoodgramUserSerializer.Meta):
-        fields = FoodgramUserSerializer.Meta.fields + [
-            "recipes",
-            "recipes_count",
-        ]
+        fields = FoodgramUserSerializer.Meta.fields + ["recipes"]
 
-    def get_recipes_count(self, object):
-        return object.recipes.count()
 
-
-class TagSerializer(ModelSerializer):
+class TagSerializer(TimedSerializerMixin, ModelSerializer):
     class Meta:
         model = Tag
+        list_serializer_class = TimedListSerializer
         fields = "__all__"
 
 
-class IngredientSerializer(ModelSerializer):
+class IngredientSerializer(TimedSerializerMixin, ModelSerializer):
     class Meta:
         model = Ingredient
+        list_serializer_class = TimedListSerializer
         fields = "__all__"
 
 
-class GetRecipeSerializer(ModelSerializer):
+class GetRecipeSerializer(
+    TimedSerializerMixin, ImageThumbnailMixin, ModelSerializer
+):
     tags = TagSerializer(many=True, read_only=True)
     author = FoodgramUserSerializer(read_only=True)
     ingredients = SerializerMethodField()
     is_favorited = SerializerMethodField(read_only=True)
     is_in_shopping_cart = SerializerMethodField(read_only=True)
     image = Base64ImageField()
+    image_thumbnail = SerializerMethodField()
 
     class Meta:
         model = Recipe
+        list_serializer_class = TimedListSerializer
         fields = [
             "id",
             "tags",
@@ -123,35 +173,79 @@ class GetRecipeSerializer(ModelSerializer):
             "is_in_shopping_cart",
             "name",
             "image",
+            "image_thumbnail",
             "text",
             "cooking_time",
+            "favorites_count",
         ]
 
     def get_ingredients(self, recipe):
-        return recipe.ingredients.values(
-            "id", "name", "measurement_unit", amount=F("recipe__amount")
-        )
+        prefetched = getattr(recipe, "_prefetched_objects_cache", {})
+        if "ingredient" not in prefetched:
+            return recipe.ingredients.values(
+                "id", "name", "measurement_unit", amount=F("recipe__amount")
+            )
+        return [
+            {
+                "id": item.ingredient.id,
+                "name": item.ingredient.name,
+                "measurement_unit": item.ingredient.measurement_unit,
+                "amount": item.amount,
+            }
+            for item in recipe.ingredient.all()
+        ]
 
     def get_is_favorited(self, recipe):
+        if hasattr(recipe, "is_favorited"):
+            return recipe.is_favorited
         user = self.context.get("request").user
         if user.is_anonymous:
             return False
         return user.favorites.filter(recipe=recipe).exists()
 
     def get_is_in_shopping_cart(self, recipe):
+        if hasattr(recipe, "is_in_shopping_cart"):
+            return recipe.is_in_shopping_cart
         user = self.context.get("request").user
         if user.is_anonymous:
             return False
         return user.shopping_cart.filter(recipe=recipe).exists()
 
+    def to_representation(self, recipe):
+        if hasattr(recipe, "is_subscribed"):
+            recipe.author.is_subscribed = recipe.is_subscribed
+        return super().to_representation(recipe)
+
+
+class PantryRecipeSerializer(GetRecipeSerializer):
+    matched_ingredients = IntegerField(read_only=True)
+    missing_ingredients = IntegerField(read_only=True)
+
+    class Meta(GetRecipeSerializer.Meta):
+        fields = GetRecipeSerializer.Meta.fields + [
+            "matched_ingredients",
+            "missing_ingredients",
+        ]
+
+
+class CachedTagField(PrimaryKeyRelatedField):
+    def to_internal_value(self, data):
+        try:
+            tag = tag_cache.get(int(data))
+        except (TypeError, ValueError):
+            self.fail("incorrect_type", data_type=type(data).__name__)
+        if tag is None:
+            self.fail("does_not_exist", pk_value=data)
+        return tag
+
 
 class AddIngredientSerializer(Serializer):
     id = IntegerField()
     amount = IntegerField(min_value=1)
 
 
-class PostRecipeSerializer(ModelSerializer):
-    tags = PrimaryKeyRelatedField(queryset=Tag.objects.all(), many=True)
+class PostRecipeSerializer(TimedSerializerMixin, ModelSerializer):
+    tags = CachedTagField(queryset=Tag.objects.all(), many=True)
     author = FoodgramUserSerializer(read_only=True)
     ingredients = AddIngredientSerializer(many=True)
     image = Base64ImageField()
@@ -184,6 +278,14 @@ class PostRecipeSerializer(ModelSerializer):
                 raise ValidationError(
                     "Количество ингредиентов должно быть больше 0"
                 )
+
+        found = Ingredient.objects.in_bulk(ingredients_id)
+        unknown = sorted(ingredients_id - found.keys())
+        if unknown:
+            raise ValidationError(
+                "Ингредиенты не найдены: "
+                + ", ".join(str(ingredient_id) for ingredient_id in unknown)
+            )
         return ingredients
 
     def validate_tags(self, tags):
@@ -206,29 +308,122 @@ class PostRecipeSerializer(ModelSerializer):
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self.__set_ingredients(recipe, ingredients)
+        Recipe.objects.filter(pk=recipe.pk).update_search_vector()
+        transaction.on_commit(lambda: refresh_similar_recipes(recipe.id))
+        schedule_image_processing(recipe)
         return recipe
 
     @transaction.atomic
     def update(self, recipe, validated_data):
-        tags = validated_data.pop("tags")
-        ingredients = validated_data.pop("ingredients")
-        RecipeIngredient.objects.filter(recipe=recipe).delete()
-        recipe.tags.set(tags)
-        self.__set_ingredients(recipe, ingredients)
-        return super().update(recipe, validated_data)
+        tags = validated_data.pop("tags", None)
+        ingredients = validated_data.pop("ingredients", None)
+        if tags is not None:
+            recipe.tags.set(tags)
+        if ingredients is not None:
+            changed, regrouped = self.__update_ingredients(
+                recipe, ingredients
+            )
+            if regrouped:
+                transaction.on_commit(
+                    lambda: refresh_similar_recipes(recipe.id)
+                )
+            if changed:
+                users = list(
+                    recipe.shopping_cart.values_list("user", flat=True)
+                )
+                if users:
+                    refresh_shopping_cart_totals(users, changed)
+        if "image" in validated_data:
+            discard_image_variants(recipe)
+        recipe = super().update(recipe, validated_data)
+        searchable = {"name", "text"} & validated_data.keys()
+        if ingredients is not None or searchable:
+            Recipe.objects.filter(pk=recipe.pk).update_search_vector()
+        if "image" in validated_data:
+            schedule_image_processing(recipe)
+        return recipe
 
-    @transaction.atomic
     def __set_ingredients(self, recipe, ingredients):
         RecipeIngredient.objects.bulk_create(
             RecipeIngredient(
                 recipe=recipe,
-                ingredient=Ingredient.objects.get(id=ingredient["id"]),
+                ingredient_id=ingredient["id"],
                 amount=ingredient["amount"],
             )
             for ingredient in ingredients
         )
 
+    def __update_ingredients(self, recipe, ingredients):
+        amounts = {
+            ingredient["id"]: ingredient["amount"]
+            for ingredient in ingredients
+        }
+        existing = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in recipe.ingredient.all()
+        }
+        removed = existing.keys() - amounts.keys()
+        added = [
+            ingredient
+            for ingredient in ingredients
+            if ingredient["id"] not in existing
+        ]
+        updated = []
+        for ingredient_id, recipe_ingredient in existing.items():
+            amount = amounts.get(ingredient_id, recipe_ingredient.amount)
+            if recipe_ingredient.amount != amount:
+                recipe_ingredient.amount = amount
+                updated.append(recipe_ingredient)
+        if removed:
+            recipe.ingredient.filter(ingredient__in=removed).delete()
+        if updated:
+            RecipeIngredient.objects.bulk_update(updated, ["amount"])
+        if added:
+            self.__set_ingredients(recipe, added)
+        return (
+            removed
+            | {ingredient["id"] for ingredient in added}
+            | {item.ingredient_id for item in updated}
+        ), bool(removed or added)
+
     def to_representation(self, instance):
         request = self.context.get("request")
         context = {"request": request}
         return GetRecipeSerializer(instance, context=context).data
+
+
+class BulkRecipesSerializer(Serializer):
+    recipes = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.BULK_RECIPES_MAX_SIZE,
+    )
+
+    def validate_recipes(self, recipes):
+        return list(dict.fromkeys(recipes))
+
+
+class PantrySearchSerializer(Serializer):
+    ingredients = ListField(
+        child=IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.PANTRY_MAX_INGREDIENTS,
+    )
+    missing = IntegerField(
+        min_value=0, max_value=settings.PANTRY_MAX_MISSING, default=0
+    )
+    tags = ListField(child=CharField(), default=list)
+    tags_mode = ChoiceField(
+        choices=(TAGS_MODE_ANY, TAGS_MODE_ALL), default=TAGS_MODE_ANY
+    )
+
+    def validate_ingredients(self, ingredients):
+        return list(dict.fromkeys(ingredients))
+
+    def validate_tags(self, slugs):
+        slugs = list(dict.fromkeys(slugs))
+        tags = tag_cache.get_by_slugs(slugs)
+        if len(tags) != len(slugs):
+            unknown = sorted(set(slugs) - {tag.slug for tag in tags})
+            raise ValidationError("Теги не найдены: " + ", ".join(unknown))
+        return [tag.id for tag in tags]
@@ -1,19 +1,227 @@
-from django.db.models import F, Sum
+import csv
+from functools import lru_cache
+from io import StringIO
+from itertools import islice
+from pathlib import Path
 
-from recipes.models import Ingredient
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Count, F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from api.pdf import TrueTypeFont, write_pdf
+from recipes.models import (
+    FavoriteRecipes,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingCartIngredient,
+)
+from users.models import Follow
+
+User = get_user_model()
+
+SHOPPING_CART_CHUNK_SIZE = 2000
+SHOPPING_CART_PDF_TITLE = "Список покупок"
+INSERT_BATCH_SIZE = 5000
+
+
+def insert_ignoring_conflicts(model, **values):
+    ops = connection.ops
+    fields = [model._meta.get_field(name) for name in values]
+    columns = ", ".join(ops.quote_name(field.column) for field in fields)
+    placeholders = ", ".join(["%s"] * len(fields))
+    sql = (
+        f"{ops.insert_statement(ignore_conflicts=True)} "
+        f"{ops.quote_name(model._meta.db_table)} ({columns}) "
+        f"VALUES ({placeholders}) "
+        f"{ops.ignore_conflicts_suffix_sql(ignore_conflicts=True)}"
+    )
+    params = [
+        field.get_db_prep_save(value, connection)
+        for field, value in zip(fields, values.values())
+    ]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return cursor.rowcount > 0
+
+
+def insert_rows(model, fields, rows, batch_size=INSERT_BATCH_SIZE):
+    rows = iter(rows)
+    created = 0
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ", ".join(
+        connection.ops.quote_name(model._meta.get_field(field).column)
+        for field in fields
+    )
+    with connection.cursor() as cursor:
+        while batch := list(islice(rows, batch_size)):
+            if connection.vendor == "postgresql":
+                buffer = StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    f"COPY {table} ({columns}) FROM STDIN WITH (FORMAT csv)",
+                    buffer,
+                )
+            else:
+                cursor.executemany(
+                    f"INSERT INTO {table} ({columns}) "
+                    f"VALUES ({', '.join(['%s'] * len(fields))})",
+                    batch,
+                )
+            created += len(batch)
+    return created
 
 
 def get_user_shopping_cart(user):
-    ingredients = (
-        Ingredient.objects.filter(recipe__recipe__shopping_cart__user=user)
+    return (
+        ShoppingCartIngredient.objects.filter(user=user)
         .values(
-            "name",
-            unit=F("measurement_unit"),
+            name=F("ingredient__name"),
+            unit=F("ingredient__measurement_unit"),
+            amount=F("total_amount"),
+        )
+        .order_by("ingredient__name", "ingredient__measurement_unit")
+    )
+
+
+def get_live_shopping_cart_totals(users=None, ingredients=None):
+    carts = ShoppingCart.objects.all()
+    if users is not None:
+        carts = carts.filter(user__in=users)
+    if ingredients is not None:
+        carts = carts.filter(recipe__ingredient__ingredient__in=ingredients)
+    return (
+        carts.values(
+            "user",
+            ingredient=F("recipe__ingredient__ingredient"),
         )
-        .annotate(amount=Sum("recipe__amount"))
+        .annotate(total_amount=Sum("recipe__ingredient__amount"))
+        .filter(ingredient__isnull=False)
+        .order_by("user_id", "ingredient")
     )
-    shopping_list = [
+
+
+@transaction.atomic
+def refresh_shopping_cart_totals(users, ingredients):
+    list(
+        User.objects.select_for_update()
+        .filter(pk__in=users)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+    ShoppingCartIngredient.objects.filter(
+        user__in=users, ingredient__in=ingredients
+    ).delete()
+    ShoppingCartIngredient.objects.bulk_create(
+        ShoppingCartIngredient(
+            user_id=total["user"],
+            ingredient_id=total["ingredient"],
+            total_amount=total["total_amount"],
+        )
+        for total in get_live_shopping_cart_totals(users, ingredients)
+    )
+
+
+def refresh_recipe_shopping_carts(recipes, ingredients):
+    users = list(
+        ShoppingCart.objects.filter(recipe__in=recipes)
+        .values_list("user", flat=True)
+        .distinct()
+    )
+    if users:
+        refresh_shopping_cart_totals(users, ingredients)
+
+
+def refresh_user_shopping_carts(users, recipes):
+    ingredients = list(
+        RecipeIngredient.objects.filter(recipe__in=recipes)
+        .values_list("ingredient", flat=True)
+        .distinct()
+    )
+    if ingredients:
+        refresh_shopping_cart_totals(users, ingredients)
+
+
+def count_subquery(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("pk"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+def refresh_favorites_count(recipes):
+    return Recipe.objects.filter(id__in=recipes).update(
+        favorites_count=count_subquery(FavoriteRecipes, "recipe")
+    )
+
+
+def recount_counters():
+    counters = (
+        (Recipe, "favorites_count", FavoriteRecipes, "recipe"),
+        (User, "recipes_count", Recipe, "author"),
+        (User, "followers_count", Follow, "author"),
+    )
+    repaired = {}
+    for model, counter, related_model, field in counters:
+        actual = count_subquery(related_model, field)
+        repaired[f"{model.__name__}.{counter}"] = (
+            model.objects.exclude(**{counter: actual}).update(
+                **{counter: actual}
+            )
+        )
+    return repaired
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def format_line(ingredient):
+    return (
         f"{ingredient['name']}: {ingredient['amount']} {ingredient['unit']}"
-        for ingredient in ingredients
-    ]
-    return "\n".join(shopping_list)
+    )
+
+
+def write_txt(ingredients):
+    for ingredient in ingredients:
+        yield format_line(ingredient) + "\n"
+
+
+def write_csv(ingredients):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(["name", "amount", "measurement_unit"])
+    for ingredient in ingredients:
+        yield writer.writerow(
+            [ingredient["name"], ingredient["amount"], ingredient["unit"]]
+        )
+
+
+@lru_cache(maxsize=None)
+def get_pdf_font():
+    return TrueTypeFont(settings.SHOPPING_CART_PDF_FONT)
+
+
+def write_pdf_list(ingredients):
+    return write_pdf(
+        map(format_line, ingredients),
+        get_pdf_font(),
+        SHOPPING_CART_PDF_TITLE,
+    )
+
+
+SHOPPING_CART_FORMATS = {
+    "txt": (write_txt, "text/plain; charset=utf-8"),
+    "csv": (write_csv, "text/csv; charset=utf-8"),
+}
+if Path(settings.SHOPPING_CART_PDF_FONT).is_file():
+    SHOPPING_CART_FORMATS["pdf"] = (write_pdf_list, "application/pdf")
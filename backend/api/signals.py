@@ -0,0 +1,78 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from api.authentication import revoke_tokens
+from api.autocomplete import INGREDIENTS_VERSION_KEY
+from api.cache import bump_version
+from api.images import delete_variants
+from api.pantry import publish_recipe_changes
+from api.performance import record_query
+from api.tags import TAGS_VERSION_KEY
+from recipes.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(**kwargs):
+    bump_version(INGREDIENTS_VERSION_KEY)
+
+
+@receiver(post_save, sender=Ingredient)
+def ingredient_saved(instance, created, **kwargs):
+    if not created:
+        Recipe.objects.filter(
+            ingredient__ingredient=instance
+        ).update_search_vector()
+
+
+@receiver(post_delete, sender=Ingredient)
+def ingredient_deleted(**kwargs):
+    transaction.on_commit(publish_recipe_changes)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+def recipe_changed(instance, **kwargs):
+    recipe_id = instance.pk
+    transaction.on_commit(lambda: publish_recipe_changes([recipe_id]))
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    image = instance.image.name
+    variants = instance.thumbnail.name, instance.webp.name
+    transaction.on_commit(lambda: delete_variants(image, *variants))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(**kwargs):
+    bump_version(TAGS_VERSION_KEY)
+
+
+@receiver(post_delete, sender=Token)
+def token_deleted(instance, **kwargs):
+    revoke_tokens(instance.user_id, instance.key)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(instance, created=False, update_fields=None, **kwargs):
+    if not created and update_fields != {"last_login"}:
+        revoke_tokens(instance.pk)
+
+
+@receiver(connection_created)
+def connection_opened(connection, **kwargs):
+    if (
+        settings.PERFORMANCE_METRICS
+        and record_query not in connection.execute_wrappers
+    ):
+        connection.execute_wrappers.insert(0, record_query)
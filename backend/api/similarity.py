@@ -0,0 +1,231 @@
+from itertools import chain
+from time import monotonic
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from scipy import sparse
+
+from api.services import insert_rows
+from recipes.models import RecipeIngredient, SimilarRecipe
+
+CANDIDATES_PER_RESULT = 4
+SIMILARITY_BATCH_SIZE = 2000
+SCORE_SCALE = 10000
+
+
+def jaccard(first, second):
+    shared = len(first & second)
+    return shared / (len(first) + len(second) - shared)
+
+
+def best_matches(ingredients, candidates, top_k):
+    scores = [
+        (round(jaccard(ingredients, other), 4), recipe)
+        for recipe, other in candidates.items()
+    ]
+    scores.sort(key=lambda item: (-item[0], -item[1]))
+    return scores[:top_k]
+
+
+def load_ingredient_matrix():
+    pairs = np.fromiter(
+        chain.from_iterable(
+            RecipeIngredient.objects.order_by()
+            .values_list("recipe", "ingredient")
+            .iterator(chunk_size=10000)
+        ),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    recipe_ids, rows = np.unique(pairs[:, 0], return_inverse=True)
+    ingredient_ids, columns = np.unique(pairs[:, 1], return_inverse=True)
+    matrix = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.int32), (rows, columns)),
+        shape=(len(recipe_ids), len(ingredient_ids)),
+    )
+    matrix.data[:] = 1
+    return recipe_ids, matrix
+
+
+def latest_postings(matrix, max_postings):
+    postings = matrix.T.tocsr()
+    postings.sort_indices()
+    counts = np.diff(postings.indptr)
+    from_end = np.repeat(postings.indptr[1:], counts) - np.arange(
+        postings.nnz
+    )
+    keep = from_end <= max_postings
+    return sparse.csr_matrix(
+        (
+            postings.data[keep],
+            postings.indices[keep],
+            np.concatenate(([0], np.cumsum(np.minimum(counts, max_postings)))),
+        ),
+        shape=postings.shape,
+    )
+
+
+def top_neighbours(matrix, postings, sizes, start, stop, top_k):
+    overlap = matrix[start:stop] @ postings
+    counts = np.diff(overlap.indptr)
+    rows = np.repeat(np.arange(stop - start, dtype=np.int32), counts)
+    columns = overlap.indices
+    shared = overlap.data
+    scores = np.rint(
+        shared
+        * float(SCORE_SCALE)
+        / (sizes[rows + start] + sizes[columns] - shared)
+    ).astype(np.int32)
+    scores[columns == rows + start] = -1
+    padded = np.full(
+        (stop - start, max(counts.max(initial=0), top_k)), -1, dtype=np.int32
+    )
+    padded[
+        rows, np.arange(len(rows)) - np.repeat(overlap.indptr[:-1], counts)
+    ] = scores
+    thresholds = np.partition(padded, -top_k, axis=1)[:, -top_k]
+    keep = scores >= np.maximum(thresholds, 0)[rows]
+    rows, columns, scores = (
+        rows[keep].astype(np.int64),
+        columns[keep].astype(np.int64),
+        scores[keep].astype(np.int64),
+    )
+    width = matrix.shape[0]
+    order = np.argsort(
+        (rows * (SCORE_SCALE + 1) + SCORE_SCALE - scores) * width
+        + width
+        - 1
+        - columns
+    )
+    rows, columns, scores = rows[order], columns[order], scores[order]
+    firsts = np.flatnonzero(np.diff(rows, prepend=-1))
+    ranks = np.arange(len(rows)) - np.repeat(
+        firsts, np.diff(np.append(firsts, len(rows)))
+    )
+    keep = ranks < top_k
+    return rows[keep] + start, columns[keep], scores[keep] / SCORE_SCALE
+
+
+def build_similarity_index(
+    top_k=None, max_postings=None, batch_size=SIMILARITY_BATCH_SIZE, log=None
+):
+    top_k = top_k or settings.SIMILAR_RECIPES_TOP_K
+    max_postings = max_postings or settings.SIMILAR_RECIPES_MAX_POSTINGS
+    started = monotonic()
+    recipe_ids, matrix = load_ingredient_matrix()
+    postings = latest_postings(matrix, max_postings)
+    sizes = np.diff(matrix.indptr)
+    if log is not None:
+        log(
+            f"Loaded {len(recipe_ids)} recipes "
+            f"in {monotonic() - started:.1f}s"
+        )
+    created = 0
+    for start in range(0, len(recipe_ids), batch_size):
+        stop = min(start + batch_size, len(recipe_ids))
+        rows, columns, scores = top_neighbours(
+            matrix, postings, sizes, start, stop, top_k
+        )
+        stale = SimilarRecipe.objects.all()
+        if start:
+            stale = stale.filter(recipe__gt=recipe_ids[start - 1])
+        if stop < len(recipe_ids):
+            stale = stale.filter(recipe__lte=recipe_ids[stop - 1])
+        with transaction.atomic():
+            stale.delete()
+            created += insert_rows(
+                SimilarRecipe,
+                ("recipe", "similar", "score"),
+                zip(
+                    recipe_ids[rows].tolist(),
+                    recipe_ids[columns].tolist(),
+                    (round(score, 4) for score in scores.tolist()),
+                ),
+            )
+        if log is not None:
+            log(f"Scored {stop} recipes in {monotonic() - started:.1f}s")
+    if not len(recipe_ids):
+        SimilarRecipe.objects.all().delete()
+    return len(recipe_ids), created
+
+
+def overlapping_recipes(recipe_id, ingredients, limit, max_postings):
+    if not ingredients:
+        return []
+    quote = connection.ops.quote_name
+    table = quote(RecipeIngredient._meta.db_table)
+    recipe = quote(RecipeIngredient._meta.get_field("recipe").column)
+    ingredient = quote(RecipeIngredient._meta.get_field("ingredient").column)
+    postings = " UNION ALL ".join(
+        f"SELECT * FROM (SELECT {recipe} FROM {table} "
+        f"WHERE {ingredient} = %s AND {recipe} <> %s "
+        f"ORDER BY {recipe} DESC LIMIT %s) AS posting_{number}"
+        for number in range(len(ingredients))
+    )
+    params = []
+    for ingredient_id in ingredients:
+        params.extend((ingredient_id, recipe_id, max_postings))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT {recipe} FROM ({postings}) AS postings "
+            f"GROUP BY {recipe} ORDER BY COUNT(*) DESC, {recipe} DESC "
+            "LIMIT %s",
+            params + [limit],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def find_similar_recipes(recipe_id, top_k, max_postings):
+    ingredients = set(
+        RecipeIngredient.objects.filter(recipe=recipe_id).values_list(
+            "ingredient", flat=True
+        )
+    )
+    candidates = {
+        recipe: set()
+        for recipe in overlapping_recipes(
+            recipe_id,
+            sorted(ingredients),
+            top_k * CANDIDATES_PER_RESULT,
+            max_postings,
+        )
+    }
+    for recipe, ingredient in RecipeIngredient.objects.filter(
+        recipe__in=candidates
+    ).values_list("recipe", "ingredient"):
+        candidates[recipe].add(ingredient)
+    return best_matches(ingredients, candidates, top_k)
+
+
+@transaction.atomic
+def refresh_similar_recipes(recipe_id):
+    matches = find_similar_recipes(
+        recipe_id,
+        settings.SIMILAR_RECIPES_TOP_K,
+        settings.SIMILAR_RECIPES_MAX_POSTINGS,
+    )
+    SimilarRecipe.objects.filter(recipe=recipe_id).delete()
+    SimilarRecipe.objects.filter(similar=recipe_id).delete()
+    SimilarRecipe.objects.bulk_create(
+        [
+            SimilarRecipe(recipe_id=recipe_id, similar_id=similar, score=score)
+            for score, similar in matches
+        ]
+        + [
+            SimilarRecipe(recipe_id=similar, similar_id=recipe_id, score=score)
+            for score, similar in matches
+        ],
+        ignore_conflicts=True,
+    )
+    neighbours = {}
+    for row_id, recipe, similar, score in SimilarRecipe.objects.filter(
+        recipe__in=[similar for _, similar in matches]
+    ).values_list("id", "recipe", "similar", "score"):
+        neighbours.setdefault(recipe, []).append((-score, -similar, row_id))
+    SimilarRecipe.objects.filter(
+        id__in=[
+            row_id
+            for rows in neighbours.values()
+            for _, _, row_id in sorted(rows)[settings.SIMILAR_RECIPES_TOP_K:]
+        ]
+    ).delete()
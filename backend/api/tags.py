@@ -0,0 +1,56 @@
+from hashlib import sha1
+from threading import Lock
+
+from rest_framework.renderers import JSONRenderer
+
+from api.cache import get_version
+from recipes.models import Tag
+
+TAGS_VERSION_KEY = "tags_version"
+
+
+class TagCache:
+    def __init__(self):
+        self._lock = Lock()
+        self._version = None
+        self._state = None
+
+    def _load(self, version):
+        from api.serializers import TagSerializer
+
+        tags = list(Tag.objects.all())
+        body = JSONRenderer().render(TagSerializer(tags, many=True).data)
+        self._state = {
+            "by_id": {tag.id: tag for tag in tags},
+            "by_slug": {tag.slug: tag for tag in tags},
+            "body": body,
+            "etag": f'"{sha1(body).hexdigest()}"',
+        }
+        self._version = version
+
+    def _refresh(self):
+        version = get_version(TAGS_VERSION_KEY)
+        if version != self._version:
+            with self._lock:
+                if version != self._version:
+                    self._load(version)
+        return self._state
+
+    def rendered(self):
+        state = self._refresh()
+        return state["body"], state["etag"]
+
+    def get(self, tag_id):
+        return self._refresh()["by_id"].get(tag_id)
+
+    def get_by_slugs(self, slugs):
+        by_slug = self._refresh()["by_slug"]
+        return [by_slug[slug] for slug in slugs if slug in by_slug]
+
+    def choices(self):
+        return [
+            (tag.slug, tag.name) for tag in self._refresh()["by_id"].values()
+        ]
+
+
+tag_cache = TagCache()
@@ -0,0 +1,1358 @@
+import asyncio
+import tracemalloc
+from collections import Counter
+from io import BytesIO, StringIO
+from tempfile import NamedTemporaryFile, TemporaryDirectory
+from threading import Barrier, Thread
+
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models import CharField, F, Value
+from django.db.models.functions import Cast, Concat
+from django.http import HttpResponse
+from django.test import AsyncClient, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.authtoken.models import Token
+from PIL import Image
+from rest_framework.test import APIClient, APITestCase
+
+from api.authentication import token_cache
+from api.autocomplete import INGREDIENTS_VERSION_KEY
+from api.cache import clear_versions
+from api.images import process_recipe_image
+from api.middleware import PerformanceMiddleware
+from api.models import RecipeChange, TokenRevocation, Version
+from api.pantry import PantryIndex, publish_recipe_changes
+from api.pdf import TrueTypeFont
+from api.seeding import seed_dataset
+from api.services import SHOPPING_CART_FORMATS, get_pdf_font, insert_rows
+from api.similarity import (
+    build_similarity_index,
+    find_similar_recipes,
+    refresh_similar_recipes,
+)
+from recipes.models import (
+    FavoriteRecipes,
+    Ingredient,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingCartIngredient,
+    SimilarRecipe,
+    Tag,
+)
+from users.models import Follow
+
+User = get_user_model()
+
+IMAGE = (
+    "data:image/gif;base64,"
+    "R0lGODlhAQABAIAAAAAAAP///yH5BAEAAAAALAAAAAABAAEAAAIBRAA7"
+)
+
+
+def create_recipes(count, ingredients_per_recipe=3):
+    users = [
+        User.objects.create_user(
+            username=f"user{i}",
+            email=f"user{i}@example.com",
+            password="password-123",
+        )
+        for i in range(3)
+    ]
+    tags = [
+        Tag.objects.create(name=f"Тег {i}", color=f"#00000{i}", slug=f"t{i}")
+        for i in range(3)
+    ]
+    ingredients = [
+        Ingredient.objects.create(
+            name=f"Ингредиент {i:03}", measurement_unit="г"
+        )
+        for i in range(40)
+    ]
+    recipes = []
+    for i in range(count):
+        recipe = Recipe.objects.create(
+            author=users[i % len(users)],
+            name=f"Рецепт {i}",
+            image="recipe_images/test.gif",
+            text="Описание",
+            cooking_time=5,
+        )
+        recipe.tags.set(tags[: 1 + i % len(tags)])
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient=ingredients[(i + k) % len(ingredients)],
+                amount=k + 1,
+            )
+            for k in range(ingredients_per_recipe)
+        )
+        recipes.append(recipe)
+    return users, tags, ingredients, recipes
+
+
+def create_shopping_carts(users, recipes):
+    for index, user in enumerate(users):
+        for recipe in recipes[index::2]:
+            ShoppingCart.objects.create(user=user, recipe=recipe)
+
+
+def client_for(user):
+    client = APIClient()
+    if user is not None:
+        token, _ = Token.objects.get_or_create(user=user)
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+    return client
+
+
+def walk_cursor(client, url, params):
+    response = client.get(url, {**params, "cursor": ""})
+    pages = [response]
+    while response.data["next"]:
+        response = client.get(response.data["next"])
+        pages.append(response)
+    return pages
+
+
+def page_ids(pages):
+    return [item["id"] for page in pages for item in page.data["results"]]
+
+
+class CacheResetMixin:
+    def setUp(self):
+        super().setUp()
+        cache.clear()
+        clear_versions()
+        token_cache.clear()
+
+
+@override_settings(VERSION_CHECK_INTERVAL=60)
+class RecipeListQueriesTest(CacheResetMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, _, _, cls.recipes = create_recipes(120)
+        user = cls.users[0]
+        Follow.objects.create(user=user, author=cls.users[1])
+        FavoriteRecipes.objects.create(user=user, recipe=cls.recipes[-2])
+        ShoppingCart.objects.create(user=user, recipe=cls.recipes[-2])
+
+    def assert_page_queries(self, client, limit, queries):
+        client.get("/api/recipes/", {"limit": limit})
+        with self.assertNumQueries(queries):
+            response = client.get("/api/recipes/", {"limit": limit})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["results"]), limit)
+        return response
+
+    def test_anonymous_page_queries_do_not_grow_with_limit(self):
+        client = client_for(None)
+        for limit in (10, 100):
+            with self.subTest(limit=limit):
+                self.assert_page_queries(client, limit, 4)
+
+    def test_authenticated_page_queries_do_not_grow_with_limit(self):
+        client = client_for(self.users[0])
+        for limit in (10, 100):
+            with self.subTest(limit=limit):
+                self.assert_page_queries(client, limit, 4)
+
+    def test_user_flags_come_from_annotations(self):
+        response = self.assert_page_queries(
+            client_for(self.users[0]), 10, 4
+        )
+        recipe = response.data["results"][1]
+        self.assertEqual(recipe["id"], self.recipes[-2].id)
+        self.assertTrue(recipe["is_favorited"])
+        self.assertTrue(recipe["is_in_shopping_cart"])
+        self.assertTrue(recipe["author"]["is_subscribed"])
+        self.assertEqual(len(recipe["ingredients"]), 3)
+
+
+class RecipeOrderingTest(CacheResetMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _, _, _, recipes = create_recipes(23)
+        Recipe.objects.filter(id__in=[r.id for r in recipes[::2]]).update(
+            pub_date=recipes[0].pub_date
+        )
+        for count in range(3):
+            Recipe.objects.filter(
+                id__in=[r.id for r in recipes[count::3]]
+            ).update(favorites_count=count)
+        cls.expected = list(
+            Recipe.objects.order_by(
+                "-favorites_count", "-pub_date", "-id"
+            ).values_list("id", flat=True)
+        )
+
+    def test_page_numbers_break_ties_by_date_and_id(self):
+        client = client_for(None)
+        ids = []
+        for page in range(1, 7):
+            response = client.get(
+                "/api/recipes/",
+                {"ordering": "-favorites_count", "limit": 4, "page": page},
+            )
+            ids.extend(item["id"] for item in response.data["results"])
+        self.assertEqual(ids, self.expected)
+
+    def test_cursor_walks_ties_without_offset(self):
+        client = client_for(None)
+        params = {"ordering": "-favorites_count", "limit": 4}
+        with CaptureQueriesContext(connection) as context:
+            pages = walk_cursor(client, "/api/recipes/", params)
+        self.assertEqual(page_ids(pages), self.expected)
+        self.assertFalse(
+            [query for query in context if "OFFSET" in query["sql"]]
+        )
+        response = pages[-1]
+        ids = page_ids(pages[-1:])
+        while response.data["previous"]:
+            response = client.get(response.data["previous"])
+            ids[:0] = page_ids([response])
+        self.assertEqual(ids, self.expected)
+
+
+class CursorPaginationTest(CacheResetMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users, _, _, recipes = create_recipes(25)
+        Recipe.objects.filter(id__in=[r.id for r in recipes[5:15]]).update(
+            pub_date=recipes[5].pub_date
+        )
+        cls.follower = users[0]
+        authors = users[1:] + [
+            User.objects.create_user(
+                username=f"author{i}",
+                email=f"author{i}@example.com",
+                password="password-123",
+            )
+            for i in range(9)
+        ]
+        for author in authors[::2] + authors[1::2]:
+            Follow.objects.create(user=cls.follower, author=author)
+
+    def assert_walk(self, url, expected, limit):
+        pages = walk_cursor(client_for(self.follower), url, {"limit": limit})
+        self.assertEqual(len(pages), -(-len(expected) // limit))
+        self.assertEqual(page_ids(pages), expected)
+
+    def test_recipes(self):
+        self.assert_walk(
+            "/api/recipes/",
+            list(
+                Recipe.objects.order_by("-pub_date", "-id").values_list(
+                    "id", flat=True
+                )
+            ),
+            4,
+        )
+
+    def test_subscriptions(self):
+        self.assert_walk(
+            "/api/users/subscriptions/",
+            list(
+                Follow.objects.filter(user=self.follower)
+                .order_by("-id")
+                .values_list("author", flat=True)
+            ),
+            3,
+        )
+
+
+class SubscriptionRecipesLimitTest(CacheResetMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors, _, _, _ = create_recipes(12)
+        cls.follower = User.objects.create_user(
+            username="follower",
+            email="follower@example.com",
+            password="password-123",
+        )
+        for author in cls.authors:
+            Follow.objects.create(user=cls.follower, author=author)
+
+    def subscriptions(self, **params):
+        response = client_for(self.follower).get(
+            "/api/users/subscriptions/", params
+        )
+        self.assertEqual(response.status_code, 200)
+        return {
+            author["id"]: [recipe["id"] for recipe in author["recipes"]]
+            for author in response.data["results"]
+        }
+
+    def latest(self, limit=None):
+        return {
+            author.id: list(
+                Recipe.objects.filter(author=author)
+                .order_by("-pub_date", "-id")
+                .values_list("id", flat=True)[:limit]
+            )
+            for author in self.authors
+        }
+
+    def test_recipes_limit(self):
+        for limit in (1, 3, 10):
+            with self.subTest(limit=limit):
+                self.assertEqual(
+                    self.subscriptions(recipes_limit=limit),
+                    self.latest(limit),
+                )
+
+    def test_missing_or_invalid_limit_returns_all_recipes(self):
+        for params in ({}, {"recipes_limit": "x"}, {"recipes_limit": "-1"}):
+            with self.subTest(params=params):
+                self.assertEqual(self.subscriptions(**params), self.latest())
+
+    def test_queries_do_not_grow_with_authors(self):
+        client = client_for(self.follower)
+        url = "/api/users/subscriptions/"
+        queries = []
+        for authors in (self.authors[:1], self.authors):
+            Follow.objects.filter(user=self.follower).delete()
+            for author in authors:
+                Follow.objects.create(user=self.follower, author=author)
+            client.get(url, {"recipes_limit": 2})
+            with CaptureQueriesContext(connection) as context:
+                response = client.get(url, {"recipes_limit": 2})
+            self.assertEqual(len(response.data["results"]), len(authors))
+            queries.append(len(context))
+        self.assertEqual(queries[0], queries[1])
+
+
+class RecipeFeedTest(CacheResetMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users, _, _, _ = create_recipes(30)
+        cls.follower = User.objects.create_user(
+            username="follower",
+            email="follower@example.com",
+            password="password-123",
+        )
+        cls.authors = users[:2]
+        for author in cls.authors:
+            Follow.objects.create(user=cls.follower, author=author)
+
+    def expected(self):
+        return list(
+            Recipe.objects.filter(author__in=self.authors)
+            .order_by("-pub_date", "-id")
+            .values_list("id", flat=True)
+        )
+
+    def test_feed_walks_followed_authors_recipes(self):
+        pages = walk_cursor(
+            client_for(self.follower), "/api/recipes/feed/", {"limit": 6}
+        )
+        self.assertEqual(len(pages), 4)
+        self.assertEqual(page_ids(pages), self.expected())
+        recipe = pages[0].data["results"][0]
+        self.assertIn(
+            recipe["author"]["id"], [author.id for author in self.authors]
+        )
+        self.assertTrue(recipe["author"]["is_subscribed"])
+        self.assertEqual(len(recipe["ingredients"]), 3)
+
+    def test_feed_requires_authentication(self):
+        response = self.client.get("/api/recipes/feed/")
+        self.assertEqual(response.status_code, 401)
+
+    def test_feed_queries_do_not_grow_with_page_size(self):
+        client = client_for(self.follower)
+        client.get("/api/recipes/feed/", {"limit": 1})
+        queries = []
+        for limit in (1, 20):
+            with CaptureQueriesContext(connection) as context:
+                response = client.get("/api/recipes/feed/", {"limit": limit})
+            self.assertEqual(len(response.data["results"]), limit)
+            queries.append(len(context))
+        self.assertEqual(queries, [4, 4])
+
+
+class IngredientAutocompleteTest(CacheResetMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.create(name="Сахар", measurement_unit="г")
+
+    def names(self):
+        response = self.client.get("/api/ingredients/", {"name": "са"})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient["name"] for ingredient in response.data]
+
+    def rename_in_another_process(self, name):
+        Ingredient.objects.update(name=name)
+        Version.objects.update_or_create(
+            key=INGREDIENTS_VERSION_KEY, defaults={"value": "other"}
+        )
+
+    @override_settings(VERSION_CHECK_INTERVAL=60)
+    def test_lookups_do_not_query_between_version_checks(self):
+        self.assertEqual(self.names(), ["Сахар"])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.names(), ["Сахар"])
+
+    @override_settings(VERSION_CHECK_INTERVAL=0)
+    def test_version_bumped_elsewhere_reloads_index(self):
+        self.assertEqual(self.names(), ["Сахар"])
+        self.rename_in_another_process("Сало")
+        self.assertEqual(self.names(), ["Сало"])
+
+    @override_settings(VERSION_CHECK_INTERVAL=60)
+    def test_load_ingredients_stores_version_in_database(self):
+        self.assertEqual(self.names(), ["Сахар"])
+        with NamedTemporaryFile("w", suffix=".csv") as file:
+            file.write("Сало,г\n")
+            file.flush()
+            call_command("load_ingredients", file.name, stdout=StringIO())
+        self.assertTrue(
+            Version.objects.filter(key=INGREDIENTS_VERSION_KEY).exists()
+        )
+        self.assertEqual(self.names(), ["Сало", "Сахар"])
+
+
+@override_settings(VERSION_CHECK_INTERVAL=0)
+class TagListETagTest(CacheResetMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.tag = Tag.objects.create(
+            name="Завтрак", color="#E26C2D", slug="b"
+        )
+        cls.admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="pw-12345"
+        )
+
+    def get_tags(self, etag=None):
+        headers = {} if etag is None else {"HTTP_IF_NONE_MATCH": etag}
+        return self.client.get("/api/tags/", **headers)
+
+    def test_list_has_etag(self):
+        response = self.get_tags()
+        self.assertEqual(response.status_code, 200)
+        self.assertRegex(response["ETag"], r'^"[0-9a-f]{40}"$')
+        self.assertEqual(response.json()[0]["slug"], "b")
+
+    def test_matching_etag_is_not_modified(self):
+        etag = self.get_tags()["ETag"]
+        for header in (etag, f'"stale", {etag}', f"W/{etag}", "*"):
+            with self.subTest(header=header):
+                response = self.get_tags(header)
+                self.assertEqual(response.status_code, 304)
+                self.assertEqual(response["ETag"], etag)
+                self.assertEqual(response.content, b"")
+
+    def test_stale_etag_gets_body(self):
+        response = self.get_tags('"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]["slug"], "b")
+
+    def test_admin_change_updates_etag(self):
+        etag = self.get_tags()["ETag"]
+        self.client.force_login(self.admin)
+        response = self.client.post(
+            f"/admin/recipes/tag/{self.tag.id}/change/",
+            {"name": "Обед", "color": "#E26C2D", "slug": "b"},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.client.logout()
+        response = self.get_tags(etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+        self.assertEqual(response.json()[0]["name"], "Обед")
+
+
+class TokenCacheTest(CacheResetMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="reader", email="reader@example.com", password="pw-12345"
+        )
+        cls.other = User.objects.create_user(
+            username="other", email="other@example.com", password="pw-12345"
+        )
+
+    def me(self, client):
+        return client.get("/api/users/me/").status_code
+
+    @override_settings(VERSION_CHECK_INTERVAL=60)
+    def test_cached_token_skips_database(self):
+        client = client_for(self.user)
+        self.assertEqual(self.me(client), 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.me(client), 200)
+
+    def test_logout_revokes_cached_token(self):
+        client = client_for(self.user)
+        self.assertEqual(self.me(client), 200)
+        response = client.post("/api/auth/token/logout/")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.me(client), 401)
+
+    @override_settings(VERSION_CHECK_INTERVAL=0)
+    def test_deactivation_in_another_process_revokes_cached_token(self):
+        client = client_for(self.user)
+        other = client_for(self.other)
+        self.assertEqual(self.me(client), 200)
+        self.assertEqual(self.me(other), 200)
+        User.objects.filter(id=self.user.id).update(is_active=False)
+        TokenRevocation.objects.create(user_id=self.user.id)
+        self.assertEqual(self.me(client), 401)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.me(other), 200)
+
+    @override_settings(VERSION_CHECK_INTERVAL=0)
+    def test_revocation_in_another_process_evicts_only_that_token(self):
+        client = client_for(self.user)
+        other = client_for(self.other)
+        self.assertEqual(self.me(client), 200)
+        self.assertEqual(self.me(other), 200)
+        TokenRevocation.objects.create(
+            user_id=self.user.id, key=self.user.auth_token.key
+        )
+        with self.assertNumQueries(2):
+            self.assertEqual(self.me(client), 200)
+        with self.assertNumQueries(1):
+            self.assertEqual(self.me(other), 200)
+
+    @override_settings(VERSION_CHECK_INTERVAL=60)
+    def test_logout_and_profile_edit_keep_other_users_cached(self):
+        client = client_for(self.user)
+        other = client_for(self.other)
+        self.assertEqual(self.me(client), 200)
+        self.assertEqual(self.me(other), 200)
+        self.user.first_name = "Изменено"
+        self.user.save()
+        with self.assertNumQueries(0):
+            self.assertEqual(self.me(other), 200)
+        response = client.post("/api/auth/token/logout/")
+        self.assertEqual(response.status_code, 204)
+        self.assertEqual(self.me(client), 401)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.me(other), 200)
+
+    @override_settings(VERSION_CHECK_INTERVAL=60)
+    def test_login_keeps_other_tokens_cached(self):
+        client = client_for(self.user)
+        self.assertEqual(self.me(client), 200)
+        response = self.client.post(
+            "/api/auth/token/login/",
+            {"email": "reader@example.com", "password": "pw-12345"},
+        )
+        self.assertEqual(response.status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.me(client), 200)
+
+
+class RecipeUpdateQueriesTest(CacheResetMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users, _, cls.ingredients, recipes = create_recipes(3, 30)
+        create_shopping_carts(users, recipes)
+        call_command("shopping_cart_totals", stdout=StringIO())
+        cls.recipe = recipes[0]
+
+    def setUp(self):
+        super().setUp()
+        self.client = client_for(self.recipe.author)
+        self.items = [
+            {"id": item.ingredient_id, "amount": item.amount}
+            for item in self.recipe.ingredient.all()
+        ]
+        self.edit(self.items)
+
+    def edit(self, items):
+        response = self.client.patch(
+            f"/api/recipes/{self.recipe.id}/",
+            {"ingredients": items},
+            format="json",
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["ingredients"]), 30)
+
+    def tearDown(self):
+        call_command("shopping_cart_totals", "--check", stdout=StringIO())
+        super().tearDown()
+
+    def test_unchanged_ingredients(self):
+        with self.assertNumQueries(8):
+            self.edit(self.items)
+
+    def test_changed_amounts(self):
+        for item in self.items[::2]:
+            item["amount"] += 1
+        with self.assertNumQueries(16):
+            self.edit(self.items)
+
+    def test_added_and_removed_ingredients(self):
+        items = self.items[2:] + [
+            {"id": ingredient.id, "amount": 1}
+            for ingredient in self.ingredients[-2:]
+        ]
+        with self.assertNumQueries(17):
+            self.edit(items)
+
+
+@override_settings(VERSION_CHECK_INTERVAL=60)
+class BulkToggleTest(CacheResetMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        users, _, _, recipes = create_recipes(202)
+        cls.user = users[0]
+        cls.ids = [recipe.id for recipe in recipes]
+        cls.missing = max(cls.ids) + 1000
+
+    def setUp(self):
+        super().setUp()
+        self.client = client_for(self.user)
+        self.client.get("/api/users/me/")
+
+    def tearDown(self):
+        call_command("shopping_cart_totals", "--check", stdout=StringIO())
+        super().tearDown()
+
+    def bulk(self, method, endpoint, ids):
+        response = getattr(self.client, method)(
+            f"/api/recipes/{endpoint}/bulk/", {"recipes": ids}, format="json"
+        )
+        self.assertEqual(response.status_code, 200)
+        return response.data["results"]
+
+    def assert_constant_queries(self, endpoint):
+        self.bulk("post", endpoint, self.ids[:1])
+        for method in ("post", "delete"):
+            with self.subTest(method=method):
+                with CaptureQueriesContext(connection) as single:
+                    self.bulk(method, endpoint, self.ids[1:2])
+                with self.assertNumQueries(len(single)):
+                    results = self.bulk(method, endpoint, self.ids[2:])
+                self.assertEqual(len(results), 200)
+
+    def assert_mixed_ids(self, endpoint, check):
+        first, second, third = self.ids[:3]
+        self.bulk("post", endpoint, [second])
+        results = self.bulk(
+            "post", endpoint, [first, self.missing, first, second]
+        )
+        self.assertEqual(
+            results,
+            [
+                {"id": first, "status": "created"},
+                {"id": self.missing, "status": "not found"},
+                {"id": second, "status": "already exists"},
+            ],
+        )
+        check({first: 1, second: 1, third: 0})
+        results = self.bulk(
+            "delete", endpoint, [second, self.missing, second, third]
+        )
+        self.assertEqual(
+            results,
+            [
+                {"id": second, "status": "deleted"},
+                {"id": self.missing, "status": "does not exist"},
+                {"id": third, "status": "does not exist"},
+            ],
+        )
+        check({first: 1, second: 0, third: 0})
+
+    def test_favorite_queries_do_not_grow_with_ids(self):
+        self.assert_constant_queries("favorite")
+        self.assertEqual(
+            list(
+                Recipe.objects.filter(favorites_count__gt=0).values_list(
+                    "id", flat=True
+                )
+            ),
+            self.ids[:1],
+        )
+
+    def test_shopping_cart_queries_do_not_grow_with_ids(self):
+        self.assert_constant_queries("shopping_cart")
+        self.assertEqual(
+            list(ShoppingCart.objects.values_list("recipe", flat=True)),
+            self.ids[:1],
+        )
+
+    def test_favorite_mixed_ids(self):
+        def check(expected):
+            self.assertEqual(
+                dict(
+                    Recipe.objects.filter(id__in=expected).values_list(
+                        "id", "favorites_count"
+                    )
+                ),
+                expected,
+            )
+
+        self.assert_mixed_ids("favorite", check)
+
+    def test_shopping_cart_mixed_ids(self):
+        def check(expected):
+            self.assertEqual(
+                set(
+                    ShoppingCart.objects.filter(
+                        user=self.user
+                    ).values_list("recipe", flat=True)
+                ),
+                {recipe for recipe, count in expected.items() if count},
+            )
+
+        self.assert_mixed_ids("shopping_cart", check)
+
+
+class ToggleConcurrencyTest(CacheResetMixin, TransactionTestCase):
+    threads = 12
+
+    def setUp(self):
+        if connection.vendor == "sqlite" and connection.is_in_memory_db():
+            self.skipTest(
+                "in-memory SQLite fails concurrent writers instead of "
+                "waiting, set DB_TEST_NAME to run on a file"
+            )
+        super().setUp()
+        self.users, _, _, self.recipes = create_recipes(2)
+        self.user = self.users[0]
+        self.token = Token.objects.create(user=self.user).key
+
+    def hammer(self, method, url):
+        statuses = Counter()
+        barrier = Barrier(self.threads)
+
+        def request():
+            client = APIClient()
+            client.credentials(HTTP_AUTHORIZATION=f"Token {self.token}")
+            try:
+                barrier.wait()
+                statuses[getattr(client, method)(url).status_code] += 1
+            finally:
+                connections.close_all()
+
+        workers = [Thread(target=request) for _ in range(self.threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return statuses
+
+    def assert_toggle(self, url, added, removed):
+        self.assertEqual(
+            self.hammer("post", url), {201: 1, 400: self.threads - 1}
+        )
+        added()
+        self.assertEqual(
+            self.hammer("delete", url), {204: 1, 400: self.threads - 1}
+        )
+        removed()
+
+    def test_favorite(self):
+        recipe = self.recipes[0]
+
+        def check(count):
+            recipe.refresh_from_db()
+            self.assertEqual(recipe.favorites_count, count)
+            self.assertEqual(
+                FavoriteRecipes.objects.filter(recipe=recipe).count(), count
+            )
+
+        self.assert_toggle(
+            f"/api/recipes/{recipe.id}/favorite/",
+            lambda: check(1),
+            lambda: check(0),
+        )
+
+    def test_shopping_cart(self):
+        recipe = self.recipes[0]
+
+        def check(count):
+            self.assertEqual(
+                ShoppingCart.objects.filter(user=self.user).count(), count
+            )
+            self.assertEqual(
+                ShoppingCartIngredient.objects.filter(user=self.user).count(),
+                3 * count,
+            )
+
+        self.assert_toggle(
+            f"/api/recipes/{recipe.id}/shopping_cart/",
+            lambda: check(1),
+            lambda: check(0),
+        )
+
+    def test_subscription(self):
+        author = self.users[1]
+
+        def check(count):
+            author.refresh_from_db()
+            self.assertEqual(author.followers_count, count)
+            self.assertEqual(
+                Follow.objects.filter(author=author).count(), count
+            )
+
+        self.assert_toggle(
+            f"/api/users/{author.id}/subscribe/",
+            lambda: check(1),
+            lambda: check(0),
+        )
+
+
+class QueryPlansTest(CacheResetMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(users=20, recipes=300, ingredients=60)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def check_plans(self):
+        call_command(
+            "check_query_plans",
+            "--prefer-indexes",
+            stdout=StringIO(),
+            stderr=StringIO(),
+        )
+
+    def test_hot_queries_use_indexes(self):
+        self.check_plans()
+
+    def test_sequential_scan_fails_the_check(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP INDEX recipe_pub_date_idx")
+        with self.assertRaisesMessage(CommandError, "query plans regressed"):
+            self.check_plans()
+
+
+class PerformanceMiddlewareTest(CacheResetMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, _, _, _ = create_recipes(20)
+        cls.staff = User.objects.create_user(
+            username="staff",
+            email="staff@example.com",
+            password="pw-12345",
+            is_staff=True,
+        )
+
+    def timings(self, response):
+        timings = {}
+        for item in response["Server-Timing"].split(", "):
+            name, duration = item.split(";")[:2]
+            timings[name] = float(duration.removeprefix("dur="))
+        return timings
+
+    def queries(self, response):
+        return int(
+            response["Server-Timing"].split('desc="')[1].split(" ")[0]
+        )
+
+    def test_server_timing_is_hidden_from_other_users(self):
+        for user in (None, self.users[0]):
+            with self.subTest(user=user):
+                response = client_for(user).get("/api/recipes/")
+                self.assertEqual(response.status_code, 200)
+                self.assertFalse(response.has_header("Server-Timing"))
+
+    def test_server_timing_for_staff(self):
+        response = client_for(self.staff).get("/api/recipes/")
+        timings = self.timings(response)
+        self.assertEqual(
+            list(timings), ["db", "serialize", "render", "total"]
+        )
+        self.assertGreater(timings["serialize"], 0)
+        self.assertLessEqual(timings["serialize"], timings["total"])
+        self.assertGreater(self.queries(response), 0)
+
+    def test_middleware_stays_async_under_asgi(self):
+        async def get_response(request):
+            return HttpResponse()
+
+        self.assertTrue(
+            asyncio.iscoroutinefunction(PerformanceMiddleware(get_response))
+        )
+        self.assertFalse(
+            asyncio.iscoroutinefunction(PerformanceMiddleware(HttpResponse))
+        )
+
+    @override_settings(PERFORMANCE_SERVER_TIMING=True)
+    async def test_async_request_records_queries(self):
+        response = await AsyncClient().get("/api/recipes/")
+        self.assertEqual(response.status_code, 200)
+        self.assertGreater(self.queries(response), 0)
+
+    @override_settings(PERFORMANCE_SERVER_TIMING=True)
+    def test_server_timing_setting_shows_it_to_everyone(self):
+        response = client_for(None).get("/api/recipes/")
+        self.assertIn("serialize", self.timings(response))
+
+    def test_metrics_require_staff(self):
+        self.assertEqual(self.client.get("/api/metrics/").status_code, 403)
+        self.client.force_login(self.users[0])
+        self.assertEqual(self.client.get("/api/metrics/").status_code, 403)
+        self.client.get("/api/recipes/")
+        self.client.force_login(self.staff)
+        response = self.client.get("/api/metrics/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            b"foodgram_request_serialize_seconds_count"
+            b'{route="api:recipes-list"',
+            response.content,
+        )
+
+    @override_settings(PERFORMANCE_METRICS_TOKEN="secret")
+    def test_metrics_accept_token(self):
+        response = self.client.get(
+            "/api/metrics/", HTTP_AUTHORIZATION="Bearer secret"
+        )
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(
+            "/api/metrics/", HTTP_AUTHORIZATION="Bearer wrong"
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+class RecipeTagsModeTest(CacheResetMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _, _, _, cls.recipes = create_recipes(12)
+
+    def found(self, **params):
+        response = self.client.get(
+            "/api/recipes/", {"tags": ["t1", "t2"], "limit": 20, **params}
+        )
+        self.assertEqual(response.status_code, 200)
+        return {recipe["id"] for recipe in response.data["results"]}
+
+    def tagged(self, *modulos):
+        return {
+            recipe.id
+            for index, recipe in enumerate(self.recipes)
+            if index % 3 in modulos
+        }
+
+    def test_any_is_default(self):
+        self.assertEqual(self.found(), self.tagged(1, 2))
+        self.assertEqual(self.found(tags_mode="any"), self.tagged(1, 2))
+
+    def test_all_requires_every_tag(self):
+        self.assertEqual(self.found(tags_mode="all"), self.tagged(2))
+        self.assertEqual(
+            self.found(tags=["t0", "t1"], tags_mode="all"),
+            self.tagged(1, 2),
+        )
+
+    def test_unknown_mode_is_rejected(self):
+        response = self.client.get(
+            "/api/recipes/", {"tags": "t1", "tags_mode": "none"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class RecipeSearchTest(CacheResetMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        _, _, _, cls.recipes = create_recipes(15)
+
+    def test_search_uses_page_numbers_by_default(self):
+        response = self.client.get("/api/recipes/", {"search": "Рецепт 1"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["count"], 6)
+
+    def test_search_with_cursor_pages_by_date(self):
+        found = []
+        params = {"search": "Рецепт 1", "limit": 4, "cursor": ""}
+        url = "/api/recipes/"
+        while url:
+            response = self.client.get(url, params)
+            self.assertEqual(response.status_code, 200)
+            found.extend(recipe["id"] for recipe in response.data["results"])
+            url, params = response.data["next"], None
+        self.assertEqual(
+            found,
+            [
+                recipe.id
+                for recipe in reversed(self.recipes)
+                if recipe.name.startswith("Рецепт 1")
+            ],
+        )
+
+
+class SimilarRecipesTest(CacheResetMixin, APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.tags, cls.ingredients, cls.recipes = create_recipes(
+            40, 5
+        )
+
+    def create_recipe(self, ingredients):
+        recipe = Recipe.objects.create(
+            author=self.users[0],
+            name="Новый рецепт",
+            image="recipe_images/test.gif",
+            text="Описание",
+            cooking_time=5,
+        )
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in ingredients
+        )
+        return recipe
+
+    def test_closest_recipes_come_first(self):
+        recipe = self.create_recipe(self.ingredients[3:8])
+        matches = find_similar_recipes(recipe.id, 3, 1000)
+        self.assertEqual(matches[0], (1.0, self.recipes[3].id))
+        self.assertEqual(
+            [similar for _, similar in matches[1:]],
+            [self.recipes[4].id, self.recipes[2].id],
+        )
+
+    def test_refresh_queries_do_not_grow_with_ingredients(self):
+        for count in (5, 30):
+            with self.subTest(ingredients=count):
+                recipe = self.create_recipe(self.ingredients[:count])
+                with self.assertNumQueries(9):
+                    refresh_similar_recipes(recipe.id)
+                self.assertTrue(
+                    SimilarRecipe.objects.filter(recipe=recipe).exists()
+                )
+
+    def neighbours(self, recipe):
+        return [
+            (score, similar)
+            for similar, score in SimilarRecipe.objects.filter(
+                recipe=recipe
+            )
+            .order_by("-score", "-similar_id")
+            .values_list("similar", "score")
+        ]
+
+    def test_batched_build_matches_single_recipe_search(self):
+        SimilarRecipe.objects.create(
+            recipe=self.recipes[0], similar=self.recipes[-1], score=0.0
+        )
+        recipes, created = build_similarity_index(3, 1000, batch_size=7)
+        self.assertEqual(recipes, 40)
+        self.assertEqual(SimilarRecipe.objects.count(), created)
+        for recipe in self.recipes:
+            self.assertEqual(
+                self.neighbours(recipe),
+                find_similar_recipes(recipe.id, 3, 1000),
+            )
+
+    @override_settings(SIMILAR_RECIPES_TOP_K=3)
+    def test_refresh_trims_reverse_neighbours(self):
+        build_similarity_index()
+        recipe = self.create_recipe(self.ingredients[3:8])
+        refresh_similar_recipes(recipe.id)
+        self.assertEqual(self.neighbours(self.recipes[3])[0], (1.0, recipe.id))
+        self.assertEqual(
+            max(
+                Counter(
+                    SimilarRecipe.objects.values_list("recipe", flat=True)
+                ).values()
+            ),
+            3,
+        )
+
+    def test_amount_only_edit_keeps_similar_recipes(self):
+        recipe = self.recipes[0]
+        refresh_similar_recipes(recipe.id)
+        ingredients = [
+            {"id": item.ingredient_id, "amount": item.amount + 1}
+            for item in recipe.ingredient.all()
+        ]
+        client = client_for(recipe.author)
+
+        def edit():
+            before = set(SimilarRecipe.objects.values_list("id", flat=True))
+            with self.captureOnCommitCallbacks(execute=True):
+                response = client.patch(
+                    f"/api/recipes/{recipe.id}/",
+                    {"ingredients": ingredients},
+                    format="json",
+                )
+            self.assertEqual(response.status_code, 200)
+            return before == set(
+                SimilarRecipe.objects.values_list("id", flat=True)
+            )
+
+        self.assertTrue(edit())
+        self.assertEqual(
+            sorted(recipe.ingredient.values_list("amount", flat=True)),
+            [2, 3, 4, 5, 6],
+        )
+        ingredients[0]["id"] = self.ingredients[-1].id
+        self.assertFalse(edit())
+
+
+class ShoppingCartExportTest(CacheResetMixin, APITestCase):
+    lines = 50000
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username="buyer", email="buyer@example.com", password="pw-12345"
+        )
+        insert_rows(
+            Ingredient,
+            ("name", "measurement_unit"),
+            ((f"Ингредиент {i:05}", "г") for i in range(cls.lines)),
+        )
+        insert_rows(
+            ShoppingCartIngredient,
+            ("user", "ingredient", "total_amount"),
+            (
+                (cls.user.id, ingredient, ingredient % 500 + 1)
+                for ingredient in Ingredient.objects.values_list(
+                    "id", flat=True
+                )
+            ),
+        )
+
+    def download(self, file_format):
+        response = client_for(self.user).get(
+            "/api/recipes/download_shopping_cart/", {"format": file_format}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response
+
+    def consume(self, response):
+        size = lines = 0
+        first = last = b""
+        tracemalloc.start()
+        try:
+            for chunk in response.streaming_content:
+                if not first:
+                    first = chunk
+                size += len(chunk)
+                lines += chunk.count(b"\n")
+                last = chunk
+            peak = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        return size, lines, first, last, peak
+
+    def assert_flat_memory(self, file_format):
+        size, _, first, last, peak = self.consume(self.download(file_format))
+        ShoppingCartIngredient.objects.filter(
+            ingredient__name__gte=f"Ингредиент {self.lines // 10:05}"
+        ).delete()
+        small_size, _, _, _, small_peak = self.consume(
+            self.download(file_format)
+        )
+        self.assertGreater(size, 2 * small_size)
+        self.assertLess(peak, 1.5 * small_peak)
+        self.assertLess(peak, 2 * 1024 * 1024)
+        return size, first, last
+
+    def test_text_export_streams_in_name_order(self):
+        _, lines, first, last, _ = self.consume(self.download("txt"))
+        self.assertEqual(lines, self.lines)
+        self.assertTrue(first.startswith("Ингредиент 00000: ".encode()))
+        self.assertTrue(last.startswith("Ингредиент 49999: ".encode()))
+        self.assert_flat_memory("txt")
+
+    def test_csv_export_streams(self):
+        _, lines, first, _, _ = self.consume(self.download("csv"))
+        self.assertEqual(lines, self.lines + 1)
+        self.assertEqual(first, b"name,amount,measurement_unit\r\n")
+        self.assert_flat_memory("csv")
+
+    def test_pdf_export_streams(self):
+        if "pdf" not in SHOPPING_CART_FORMATS:
+            self.skipTest("PDF font is not installed")
+        get_pdf_font().glyph_offsets
+        _, first, last = self.assert_flat_memory("pdf")
+        self.assertTrue(first.startswith(b"%PDF-1.4"))
+        self.assertTrue(last.endswith(b"%%EOF\n"))
+
+    def test_pdf_embeds_used_glyphs_only(self):
+        if "pdf" not in SHOPPING_CART_FORMATS:
+            self.skipTest("PDF font is not installed")
+        font = get_pdf_font()
+        used = {font.glyphs[char] for char in "Ингредиент 09: г"}
+        with NamedTemporaryFile(suffix=".ttf") as file:
+            file.write(font.subset(used))
+            file.flush()
+            subset = TrueTypeFont(file.name)
+        self.assertLess(len(subset.data), len(font.data) // 10)
+        self.assertEqual(subset.glyphs, font.glyphs)
+        self.assertEqual(subset.advances, font.advances)
+        for glyph in used:
+            self.assertTrue(
+                subset.glyph_data(glyph).startswith(font.glyph_data(glyph))
+            )
+        self.assertEqual(subset.glyph_data(font.glyphs["Z"]), b"")
+
+    def test_unknown_format_is_rejected(self):
+        response = client_for(self.user).get(
+            "/api/recipes/download_shopping_cart/", {"format": "doc"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ShoppingCartTotalsCommandTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, _, ingredients, recipes = create_recipes(30, 5)
+        Ingredient.objects.filter(
+            id__in=[ingredient.id for ingredient in ingredients]
+        ).update(
+            name=Concat(Value("Ингредиент "), Cast(-F("id"), CharField()))
+        )
+        create_shopping_carts(cls.users, recipes)
+
+    def check(self):
+        call_command("shopping_cart_totals", "--check", stdout=StringIO())
+
+    def test_rebuilt_table_is_in_sync(self):
+        call_command("shopping_cart_totals", stdout=StringIO())
+        self.assertTrue(ShoppingCartIngredient.objects.exists())
+        self.check()
+
+    def test_check_reports_drift(self):
+        call_command("shopping_cart_totals", stdout=StringIO())
+        total = ShoppingCartIngredient.objects.order_by("id").first()
+        total.total_amount += 1
+        total.save()
+        ShoppingCartIngredient.objects.order_by("id").last().delete()
+        with self.assertRaisesMessage(
+            CommandError, "1 missing, 0 extra, 1 mismatched"
+        ):
+            self.check()
+
+
+class PantryIndexTest(APITestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users, cls.tags, cls.ingredients, cls.recipes = create_recipes(
+            20
+        )
+
+    def search(self, index, ingredients):
+        return [
+            match.recipe for match in index.search(ingredients, missing=2)[:50]
+        ]
+
+    def test_index_applies_published_changes(self):
+        index = PantryIndex()
+        first = self.ingredients[0].id
+        self.assertEqual(self.search(index, [first]), [self.recipes[0].id])
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe = Recipe.objects.create(
+                author=self.users[0],
+                name="Новый рецепт",
+                image="recipe_images/test.gif",
+                text="Описание",
+                cooking_time=5,
+            )
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=self.ingredients[0], amount=1
+            )
+        with self.assertNumQueries(4):
+            found = self.search(index, [first])
+        self.assertEqual(found, [recipe.id, self.recipes[0].id])
+
+    def test_gap_in_change_log_reloads_index(self):
+        index = PantryIndex()
+        first = self.ingredients[0].id
+        self.search(index, [first])
+        RecipeIngredient.objects.filter(recipe=self.recipes[0]).delete()
+        publish_recipe_changes([self.recipes[0].id])
+        publish_recipe_changes([self.recipes[1].id])
+        RecipeChange.objects.order_by("id").first().delete()
+        self.assertEqual(self.search(index, [first]), [])
+
+
+@override_settings(RECIPE_IMAGE_WORKERS=0)
+class RecipeImageVariantsTest(CacheResetMixin, APITestCase):
+    def setUp(self):
+        super().setUp()
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+        self.author = User.objects.create_user(
+            username="cook", email="cook@example.com", password="pw-12345"
+        )
+
+    def upload(self, name, file_format):
+        buffer = BytesIO()
+        Image.new("RGB", (400, 300), "red").save(buffer, file_format)
+        return default_storage.save(
+            f"recipe_images/{name}", ContentFile(buffer.getvalue())
+        )
+
+    def create_recipe(self, image):
+        return Recipe.objects.create(
+            author=self.author,
+            name=image,
+            image=image,
+            text="Описание",
+            cooking_time=5,
+        )
+
+    def process(self, recipe):
+        with self.captureOnCommitCallbacks(execute=True):
+            process_recipe_image(recipe.id, recipe.image.name)
+        recipe.refresh_from_db()
+        return recipe.thumbnail.name, recipe.webp.name
+
+    def test_variants_of_same_named_uploads_do_not_collide(self):
+        recipes = [
+            self.create_recipe(self.upload("photo.png", "PNG")),
+            self.create_recipe(self.upload("photo.jpeg", "JPEG")),
+            self.create_recipe(self.upload("photo.webp", "WEBP")),
+        ]
+        originals = [recipe.image.name for recipe in recipes]
+        webp_original = default_storage.open(originals[2]).read()
+        variants = [
+            name for recipe in recipes for name in self.process(recipe)
+        ]
+        self.assertEqual(len(set(variants + originals)), 9)
+        for name in variants + originals:
+            self.assertTrue(default_storage.exists(name), name)
+        self.assertEqual(
+            default_storage.open(originals[2]).read(), webp_original
+        )
+        self.assertEqual(variants[0], f"{originals[0]}.thumb.webp")
+        self.assertEqual(variants[1], f"{originals[0]}.webp")
+
+    def test_reprocessing_deletes_only_own_previous_variants(self):
+        recipe = self.create_recipe(self.upload("photo.png", "PNG"))
+        other = self.create_recipe(self.upload("photo.png", "PNG"))
+        other_variants = self.process(other)
+        previous = self.process(recipe)
+        current = self.process(recipe)
+        self.assertTrue(set(previous).isdisjoint(current))
+        for name in previous:
+            self.assertFalse(default_storage.exists(name), name)
+        for name in current + other_variants:
+            self.assertTrue(default_storage.exists(name), name)
+
+    def test_new_image_deletes_previous_variants(self):
+        recipe = self.create_recipe(self.upload("photo.png", "PNG"))
+        previous = self.process(recipe)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client_for(self.author).patch(
+                f"/api/recipes/{recipe.id}/", {"image": IMAGE}, format="json"
+            )
+        self.assertEqual(response.status_code, 200)
+        recipe.refresh_from_db()
+        for name in previous:
+            self.assertFalse(default_storage.exists(name), name)
+        self.assertTrue(recipe.thumbnail.name.endswith(".gif.thumb.webp"))
+        self.assertTrue(default_storage.exists(recipe.thumbnail.name))
+
+    def test_deleted_recipe_deletes_variants(self):
+        recipe = self.create_recipe(self.upload("photo.png", "PNG"))
+        variants = self.process(recipe)
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        for name in variants:
+            self.assertFalse(default_storage.exists(name), name)
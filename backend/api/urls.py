@@ -1,7 +1,14 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from api.views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from api.async_views import with_async_reads
+from api.views import (
+    IngredientViewSet,
+    RecipeViewSet,
+    TagViewSet,
+    UserViewSet,
+    metrics,
+)
 
 app_name = "api"
 
@@ -13,6 +20,7 @@ router.register("recipes", RecipeViewSet, "recipes")
 router.register("users", UserViewSet, "users")
 
 urlpatterns = (
-    path("", include(router.urls)),
+    path("", include(with_async_reads(router.urls))),
     path("auth/", include("djoser.urls.authtoken")),
+    path("metrics/", metrics, name="metrics"),
 )
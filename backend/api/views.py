@@ -1,6 +1,19 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.http.response import HttpResponse
+from django.db import transaction
+from django.db.models import (
+    Exists,
+    F,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    Value,
+)
+from django.http import Http404
+from django.http.response import HttpResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.crypto import constant_time_compare
+from django.utils.http import parse_etags
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import status
@@ -12,24 +25,50 @@ from rest_framework.permissions import (
 from rest_framework.response import Response
 from rest_framework.viewsets import ModelViewSet, ReadOnlyModelViewSet
 
-from api.filters import IngredientFilter, RecipeFilter
-from api.pagination import PageLimitPagination
+from api.autocomplete import ingredient_index
+from api.filters import (
+    TAGS_MODE_ALL,
+    IngredientFilter,
+    RecipeFilter,
+    RecipeOrderingFilter,
+)
+from api.pagination import (
+    FeedPagination,
+    PageLimitPagination,
+    RecipePagination,
+    SubscriptionPagination,
+)
+from api.pantry import pantry_index
+from api.performance import metrics_registry
 from api.permissions import IsAdminOrReadOnly, IsOwnerOrReadOnly
 from api.serializers import (
+    BulkRecipesSerializer,
     FollowSerializer,
     FoodgramUserSerializer,
     GetRecipeSerializer,
     IngredientSerializer,
+    PantryRecipeSerializer,
+    PantrySearchSerializer,
     PostRecipeSerializer,
     PreviewRecipeSerializer,
     TagSerializer,
 )
-from api.services import get_user_shopping_cart
+from api.services import (
+    SHOPPING_CART_CHUNK_SIZE,
+    SHOPPING_CART_FORMATS,
+    get_user_shopping_cart,
+    insert_ignoring_conflicts,
+    refresh_favorites_count,
+    refresh_shopping_cart_totals,
+)
+from api.tags import tag_cache
 from recipes.models import (
     FavoriteRecipes,
     Ingredient,
     Recipe,
+    RecipeIngredient,
     ShoppingCart,
+    ShoppingCartIngredient,
     Tag,
 )
 from users.models import Follow
@@ -43,51 +82,95 @@ class UserViewSet(DjoserUserViewSet):
     permission_classes = (IsAuthenticatedOrReadOnly,)
     pagination_class = PageLimitPagination
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if self.action in ("list", "retrieve") and user.is_authenticated:
+            queryset = queryset.annotate(
+                is_subscribed=Exists(
+                    Follow.objects.filter(user=user, author=OuterRef("pk"))
+                )
+            )
+        return queryset
+
     @action(
         detail=True,
         methods=["post", "delete"],
         permission_classes=(IsAuthenticated,),
     )
+    @transaction.atomic
     def subscribe(self, request, id):
         user = request.user
-        author = get_object_or_404(User, id=id)
-        sub = Follow.objects.filter(user=user, author=author)
-
         if request.method == "DELETE":
-            if sub.exists():
-                sub.delete()
-                return Response(status=status.HTTP_204_NO_CONTENT)
-            return Response(
-                {"errors": "You are not subscribed to this author"},
-                status=status.HTTP_400_BAD_REQUEST,
-            )
-        if request.method == "POST":
-            if sub.exists():
+            deleted, _ = Follow.objects.filter(
+                user=user, author_id=id
+            ).delete()
+            if not deleted:
                 return Response(
-                    {"errors": "You are already subscribed to this author"},
+                    {"errors": "You are not subscribed to this author"},
                     status=status.HTTP_400_BAD_REQUEST,
                 )
-            follow = Follow.objects.create(user=user, author=author)
-            serializer = FollowSerializer(
-                follow.author,
-                context={"request": request},
+            User.objects.filter(id=id).update(
+                followers_count=F("followers_count") - 1
             )
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        if str(user.id) == id:
+            return Response(
+                {"errors": "You can not subscribe to yourself"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        if not insert_ignoring_conflicts(Follow, user=user.id, author=id):
+            return Response(
+                {"errors": "You are already subscribed to this author"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        author = self.__with_recipes(User.objects.filter(id=id)).first()
+        if author is None:
+            raise Http404
+        User.objects.filter(id=id).update(
+            followers_count=F("followers_count") + 1
+        )
+        author.followers_count += 1
+        serializer = FollowSerializer(author, context={"request": request})
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     @action(
         detail=False,
         methods=["get"],
         permission_classes=(IsAuthenticated,),
+        pagination_class=SubscriptionPagination,
     )
     def subscriptions(self, request):
         user = request.user
+        queryset = self.__with_recipes(
+            User.objects.filter(following__user=user).annotate(
+                follow_id=F("following__id")
+            )
+        ).order_by("-follow_id")
         serializer = FollowSerializer(
-            self.paginate_queryset(User.objects.filter(following__user=user)),
+            self.paginate_queryset(queryset),
             many=True,
             context={"request": request},
         )
         return self.get_paginated_response(serializer.data)
 
+    def __with_recipes(self, queryset):
+        recipes = Recipe.objects.order_by("-pub_date", "-id")
+        limit = self.request.query_params.get("recipes_limit")
+        if limit is not None and limit.isdigit():
+            recipes = recipes.filter(
+                id__in=Subquery(
+                    Recipe.objects.filter(author=OuterRef("author"))
+                    .order_by("-pub_date", "-id")
+                    .values("id")[: int(limit)]
+                )
+            )
+        return (
+            queryset.annotate(is_subscribed=Value(True))
+            .prefetch_related(Prefetch("recipes", queryset=recipes))
+            .order_by("id")
+        )
+
     @action(
         detail=False,
         methods=["get"],
@@ -104,6 +187,16 @@ class TagViewSet(ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     permission_classes = (IsAdminOrReadOnly,)
 
+    def list(self, request, *args, **kwargs):
+        body, etag = tag_cache.rendered()
+        etags = parse_etags(request.headers.get("If-None-Match", ""))
+        if "*" in etags or etag in {tag.removeprefix("W/") for tag in etags}:
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            response = HttpResponse(body, content_type="application/json")
+        response["ETag"] = etag
+        return response
+
 
 class IngredientViewSet(ReadOnlyModelViewSet):
     queryset = Ingredient.objects.all()
@@ -112,57 +205,276 @@ class IngredientViewSet(ReadOnlyModelViewSet):
     filter_backends = (DjangoFilterBackend,)
     filterset_class = IngredientFilter
 
+    def list(self, request, *args, **kwargs):
+        name = request.query_params.get("name")
+        if not name:
+            return super().list(request, *args, **kwargs)
+        return Response(ingredient_index.search(name))
+
 
 class RecipeViewSet(ModelViewSet):
     queryset = Recipe.objects.all()
-    pagination_class = PageLimitPagination
+    pagination_class = RecipePagination
     permission_classes = (IsOwnerOrReadOnly | IsAdminOrReadOnly,)
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, RecipeOrderingFilter)
     filterset_class = RecipeFilter
+    ordering_fields = ("pub_date", "favorites_count")
+    ordering = ("-pub_date", "-id")
 
+    def get_queryset(self):
+        user = self.request.user
+        if self.action in ("list", "retrieve", "feed", "pantry"):
+            return super().get_queryset().for_representation(user)
+        return (
+            super()
+            .get_queryset()
+            .with_user_flags(user)
+            .select_related("author")
+        )
+
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        User.objects.filter(id=self.request.user.id).update(
+            recipes_count=F("recipes_count") + 1
+        )
+
+    @transaction.atomic
+    def perform_destroy(self, instance):
+        users = list(instance.shopping_cart.values_list("user", flat=True))
+        ingredients = list(
+            instance.ingredient.values_list("ingredient", flat=True)
+        )
+        instance.delete()
+        User.objects.filter(id=instance.author_id).update(
+            recipes_count=F("recipes_count") - 1
+        )
+        if users:
+            refresh_shopping_cart_totals(users, ingredients)
+
+    def perform_content_negotiation(self, request, force=False):
+        if self.action == "download_shopping_cart":
+            force = True
+        return super().perform_content_negotiation(request, force)
 
     def get_serializer_class(self):
+        if self.action == "pantry":
+            return PantryRecipeSerializer
         if self.request.method == "GET":
             return GetRecipeSerializer
         return PostRecipeSerializer
 
+    @action(
+        methods=["get"],
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        pagination_class=FeedPagination,
+    )
+    def feed(self, request):
+        page = self.paginate_queryset(
+            Recipe.objects.filter(
+                author__in=Follow.objects.filter(user=request.user).values(
+                    "author"
+                )
+            ).values("id", "pub_date")
+        )
+        recipes = self.get_queryset().in_bulk([row["id"] for row in page])
+        serializer = self.get_serializer(
+            [recipes[row["id"]] for row in page if row["id"] in recipes],
+            many=True,
+        )
+        return self.get_paginated_response(serializer.data)
+
+    @action(
+        methods=["get"],
+        detail=False,
+        pagination_class=PageLimitPagination,
+    )
+    def pantry(self, request):
+        params = PantrySearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        page = self.paginate_queryset(
+            pantry_index.search(
+                params.validated_data["ingredients"],
+                params.validated_data["missing"],
+                params.validated_data["tags"],
+                params.validated_data["tags_mode"] == TAGS_MODE_ALL,
+            )
+        )
+        recipes = self.get_queryset().in_bulk(
+            [match.recipe for match in page]
+        )
+        found = []
+        for match in page:
+            recipe = recipes.get(match.recipe)
+            if recipe is not None:
+                recipe.matched_ingredients = match.matched
+                recipe.missing_ingredients = match.missing
+                found.append(recipe)
+        serializer = self.get_serializer(found, many=True)
+        return self.get_paginated_response(serializer.data)
+
+    @action(methods=["get"], detail=True)
+    def similar(self, request, pk):
+        recipe = get_object_or_404(Recipe.objects.only("id"), id=pk)
+        recipes = Recipe.objects.filter(similar_to__recipe=recipe).order_by(
+            "-similar_to__score", "-id"
+        )[: settings.SIMILAR_RECIPES_TOP_K]
+        serializer = PreviewRecipeSerializer(
+            recipes, many=True, context={"request": request}
+        )
+        return Response(serializer.data)
+
     @action(
         methods=["post", "delete"],
         detail=True,
         permission_classes=(IsAuthenticated,),
     )
+    @transaction.atomic
     def favorite(self, request, pk):
         if request.method == "POST":
-            return self.__add(FavoriteRecipes, request.user, pk)
-        return self.__delete(FavoriteRecipes, request.user, pk)
+            response = self.__add(FavoriteRecipes, request.user, pk)
+            delta = 1
+        else:
+            response = self.__delete(FavoriteRecipes, request.user, pk)
+            delta = -1
+        if status.is_success(response.status_code):
+            Recipe.objects.filter(id=pk).update(
+                favorites_count=F("favorites_count") + delta
+            )
+        return response
 
     @action(
         methods=["post", "delete"],
         detail=True,
         permission_classes=(IsAuthenticated,),
     )
+    @transaction.atomic
     def shopping_cart(self, request, pk):
         if request.method == "POST":
-            return self.__add(ShoppingCart, request.user, pk)
-        return self.__delete(ShoppingCart, request.user, pk)
+            response = self.__add(ShoppingCart, request.user, pk)
+        else:
+            response = self.__delete(ShoppingCart, request.user, pk)
+        if status.is_success(response.status_code):
+            refresh_shopping_cart_totals(
+                [request.user.id],
+                RecipeIngredient.objects.filter(recipe=pk).values(
+                    "ingredient"
+                ),
+            )
+        return response
+
+    @action(
+        methods=["post", "delete"],
+        detail=False,
+        url_path="favorite/bulk",
+        permission_classes=(IsAuthenticated,),
+    )
+    @transaction.atomic
+    def favorite_bulk(self, request):
+        serializer = BulkRecipesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results, changed = self.__bulk_change(
+            FavoriteRecipes, request, serializer.validated_data["recipes"]
+        )
+        if changed:
+            refresh_favorites_count(changed)
+        return Response({"results": results})
+
+    @action(
+        methods=["post", "delete"],
+        detail=False,
+        url_path="shopping_cart/bulk",
+        permission_classes=(IsAuthenticated,),
+    )
+    @transaction.atomic
+    def shopping_cart_bulk(self, request):
+        serializer = BulkRecipesSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        results, changed = self.__bulk_change(
+            ShoppingCart, request, serializer.validated_data["recipes"]
+        )
+        if changed:
+            refresh_shopping_cart_totals(
+                [request.user.id],
+                RecipeIngredient.objects.filter(recipe__in=changed).values(
+                    "ingredient"
+                ),
+            )
+        return Response({"results": results})
+
+    @action(
+        methods=["delete"],
+        detail=False,
+        url_path="shopping_cart",
+        permission_classes=(IsAuthenticated,),
+    )
+    @transaction.atomic
+    def clear_shopping_cart(self, request):
+        ShoppingCart.objects.filter(user=request.user).delete()
+        ShoppingCartIngredient.objects.filter(user=request.user).delete()
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    def __bulk_change(self, model, request, recipe_ids):
+        user = request.user
+        existing = set(
+            model.objects.filter(
+                user=user, recipe__in=recipe_ids
+            ).values_list("recipe", flat=True)
+        )
+        if request.method == "DELETE":
+            model.objects.filter(user=user, recipe__in=existing).delete()
+            results = [
+                {
+                    "id": recipe_id,
+                    "status": "deleted"
+                    if recipe_id in existing
+                    else "does not exist",
+                }
+                for recipe_id in recipe_ids
+            ]
+            return results, existing
+        found = set(
+            Recipe.objects.filter(id__in=recipe_ids).values_list(
+                "id", flat=True
+            )
+        )
+        created = [
+            recipe_id
+            for recipe_id in recipe_ids
+            if recipe_id in found and recipe_id not in existing
+        ]
+        model.objects.bulk_create(
+            (model(user=user, recipe_id=recipe_id) for recipe_id in created),
+            ignore_conflicts=True,
+        )
+        statuses = {
+            **dict.fromkeys(found, "created"),
+            **dict.fromkeys(existing, "already exists"),
+        }
+        results = [
+            {"id": recipe_id, "status": statuses.get(recipe_id, "not found")}
+            for recipe_id in recipe_ids
+        ]
+        return results, created
 
     def __add(self, model, user, recipe_id):
-        if model.objects.filter(user=user, recipe__id=recipe_id).exists():
+        if not insert_ignoring_conflicts(
+            model, user=user.id, recipe=recipe_id
+        ):
             return Response(
                 {"errors": "already exists"},
                 status=status.HTTP_400_BAD_REQUEST,
             )
         recipe = get_object_or_404(Recipe, id=recipe_id)
-        model.objects.create(user=user, recipe=recipe)
         serializer = PreviewRecipeSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
     def __delete(self, model, user, recipe_id):
-        obj = model.objects.filter(user=user, recipe__id=recipe_id)
-        if obj.exists():
-            obj.delete()
+        deleted, _ = model.objects.filter(
+            user=user, recipe_id=recipe_id
+        ).delete()
+        if deleted:
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(
             {"errors": "does not exist"},
@@ -175,11 +487,35 @@ class RecipeViewSet(ModelViewSet):
         permission_classes=(IsAuthenticated,),
     )
     def download_shopping_cart(self, request):
-        shopping_list = get_user_shopping_cart(request.user)
-        response = HttpResponse(
-            shopping_list,
-            content_type="text.txt; charset=utf-8",
+        file_format = request.query_params.get("format", "txt")
+        if file_format not in SHOPPING_CART_FORMATS:
+            return Response(
+                {"errors": f"unsupported format: {file_format}"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        writer, content_type = SHOPPING_CART_FORMATS[file_format]
+        response = StreamingHttpResponse(
+            writer(
+                get_user_shopping_cart(request.user).iterator(
+                    chunk_size=SHOPPING_CART_CHUNK_SIZE
+                )
+            ),
+            content_type=content_type,
         )
-        file_name = f"{request.user.username}_shopping_list.txt"
+        file_name = f"{request.user.username}_shopping_list.{file_format}"
         response["Content-Disposition"] = f"attachment; filename={file_name}"
         return response
+
+
+def metrics(request):
+    token = settings.PERFORMANCE_METRICS_TOKEN
+    if not request.user.is_staff and not (
+        token
+        and constant_time_compare(
+            request.headers.get("Authorization", ""), f"Bearer {token}"
+        )
+    ):
+        return HttpResponse(status=status.HTTP_403_FORBIDDEN)
+    return HttpResponse(
+        metrics_registry.render(), content_type="text/plain; version=0.0.4"
+    )
@@ -34,6 +34,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "api.middleware.PerformanceMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -71,6 +72,17 @@ DATABASES = {
         "PASSWORD": os.getenv("POSTGRES_PASSWORD", default="postgres"),
         "HOST": os.getenv("DB_HOST", default="localhost"),
         "PORT": os.getenv("DB_PORT", default="32702"),
+        "TEST": {"NAME": os.getenv("DB_TEST_NAME")},
+    }
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", default=""),
     }
 }
 
@@ -97,10 +109,13 @@ REST_FRAMEWORK = {
         "rest_framework.permissions.AllowAny",
     ],
     "DEFAULT_AUTHENTICATION_CLASSES": [
-        "rest_framework.authentication.TokenAuthentication",
+        "api.authentication.CachedTokenAuthentication",
     ],
 }
 
+TOKEN_CACHE_SIZE = 10000
+TOKEN_CACHE_TTL = 60
+
 DJOSER = {
     "HIDE_USERS": False,
     "LOGIN_FIELD": "email",
@@ -132,6 +147,41 @@ STATIC_ROOT = os.path.join(BASE_DIR, "static/")
 MEDIA_URL = "/media/"
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
 
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+RECIPE_IMAGE_WORKERS = int(os.getenv("RECIPE_IMAGE_WORKERS", default=2))
+RECIPE_THUMBNAIL_SIZE = (480, 480)
+RECIPE_IMAGE_WEBP_QUALITY = 80
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 DEFAULT_PAGE_SIZE = 10
+
+SHOPPING_CART_PDF_FONT = os.getenv(
+    "SHOPPING_CART_PDF_FONT",
+    default="/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf",
+)
+
+VERSION_CHECK_INTERVAL = float(os.getenv("VERSION_CHECK_INTERVAL", default=1))
+
+INGREDIENTS_AUTOCOMPLETE_LIMIT = 50
+
+BULK_RECIPES_MAX_SIZE = 500
+
+SIMILAR_RECIPES_TOP_K = 10
+SIMILAR_RECIPES_MAX_POSTINGS = 1000
+
+PANTRY_MAX_INGREDIENTS = 50
+PANTRY_MAX_MISSING = 5
+PANTRY_MAX_PENDING_CHANGES = 1000
+
+ASYNC_READ_WORKERS = int(os.getenv("ASYNC_READ_WORKERS", default=0))
+
+PERFORMANCE_METRICS = os.getenv("PERFORMANCE_METRICS", default="1") == "1"
+PERFORMANCE_METRICS_TOKEN = os.getenv("PERFORMANCE_METRICS_TOKEN", default="")
+PERFORMANCE_SERVER_TIMING = (
+    os.getenv("PERFORMANCE_SERVER_TIMING", default="0") == "1"
+)
+PERFORMANCE_SLOW_REQUEST_MS = int(
+    os.getenv("PERFORMANCE_SLOW_REQUEST_MS", default=500)
+)
+PERFORMANCE_SLOW_REQUEST_STATEMENTS = 5
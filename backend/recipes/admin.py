@@ -1,7 +1,14 @@
 from django.contrib import admin
+from django.db.models import Exists, OuterRef
 from import_export import resources
 from import_export.admin import ImportExportModelAdmin
 
+from api.services import (
+    refresh_recipe_shopping_carts,
+    refresh_shopping_cart_totals,
+    refresh_user_shopping_carts,
+)
+
 from .models import (
     FavoriteRecipes,
     Ingredient,
@@ -10,14 +17,35 @@ from .models import (
     ShoppingCart,
     Tag,
 )
+from .paginators import EstimatedCountPaginator
 
 
 class IngredientInline(admin.TabularInline):
     model = RecipeIngredient
+    autocomplete_fields = ["ingredient"]
     min_num = 1
     extra = 1
 
 
+class TagListFilter(admin.SimpleListFilter):
+    title = "Теги"
+    parameter_name = "tag"
+
+    def lookups(self, request, model_admin):
+        return Tag.objects.values_list("slug", "name")
+
+    def queryset(self, request, queryset):
+        if self.value() is None:
+            return queryset
+        return queryset.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=OuterRef("pk"), tag__slug=self.value()
+                )
+            )
+        )
+
+
 class IngredientResource(resources.ModelResource):
     class Meta:
         model = Ingredient
@@ -30,29 +58,85 @@ class ImportIngredientsAdmin(ImportExportModelAdmin):
     resource_class = IngredientResource
     list_display = ["name", "measurement_unit"]
     search_fields = ["name"]
-    list_filter = ["name"]
+    list_filter = ["measurement_unit"]
 
 
 @admin.register(RecipeIngredient)
 class RecipeIngredientAdmin(admin.ModelAdmin):
     list_display = ("recipe", "ingredient", "amount")
+    list_select_related = ("recipe", "ingredient")
+    raw_id_fields = ("recipe",)
+    autocomplete_fields = ("ingredient",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        refresh_recipe_shopping_carts(
+            {obj.recipe_id, form.initial.get("recipe")} - {None},
+            {obj.ingredient_id, form.initial.get("ingredient")} - {None},
+        )
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        refresh_recipe_shopping_carts([obj.recipe_id], [obj.ingredient_id])
+
+    def delete_queryset(self, request, queryset):
+        rows = list(queryset.values_list("recipe", "ingredient"))
+        super().delete_queryset(request, queryset)
+        if rows:
+            recipes, ingredients = zip(*rows)
+            refresh_recipe_shopping_carts(set(recipes), set(ingredients))
 
 
 @admin.register(FavoriteRecipes)
 class FavoriteRecipesAdmin(admin.ModelAdmin):
     list_display = ("recipe", "user")
+    list_select_related = ("recipe", "user")
+    raw_id_fields = ("recipe",)
+    autocomplete_fields = ("user",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(ShoppingCart)
 class ShoppingCartAdmin(admin.ModelAdmin):
     list_display = ("recipe", "user")
+    list_select_related = ("recipe", "user")
+    raw_id_fields = ("recipe",)
+    autocomplete_fields = ("user",)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        refresh_user_shopping_carts(
+            {obj.user_id, form.initial.get("user")} - {None},
+            {obj.recipe_id, form.initial.get("recipe")} - {None},
+        )
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        refresh_user_shopping_carts([obj.user_id], [obj.recipe_id])
+
+    def delete_queryset(self, request, queryset):
+        rows = list(queryset.values_list("user", "recipe"))
+        super().delete_queryset(request, queryset)
+        if rows:
+            users, recipes = zip(*rows)
+            refresh_user_shopping_carts(set(users), set(recipes))
 
 
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     list_display = ["name", "author", "count_in_favorites"]
-    list_filter = ["name", "author", "tags"]
-    search_fields = ["name", "author__username", "tags__name"]
+    list_select_related = ["author"]
+    list_filter = [TagListFilter]
+    search_fields = ["name", "author__username"]
+    autocomplete_fields = ["author", "tags"]
+    ordering = ["-pub_date", "-id"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     readonly_fields = ["count_in_favorites"]
     fields = [
         ("name", "author"),
@@ -64,10 +148,46 @@ class RecipeAdmin(admin.ModelAdmin):
     ]
     inlines = [IngredientInline]
 
+    @admin.display(description="В избранном", ordering="favorites_count")
     def count_in_favorites(self, obj):
-        return obj.in_favorite.count()
+        return obj.favorites_count
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).defer("search_vector")
+
+    def save_related(self, request, form, formsets, change):
+        recipe = form.instance
+        ingredients = set(self.get_ingredients([recipe.pk]))
+        super().save_related(request, form, formsets, change)
+        Recipe.objects.filter(pk=recipe.pk).update_search_vector()
+        if any(formset.has_changed() for formset in formsets):
+            ingredients.update(self.get_ingredients([recipe.pk]))
+            refresh_recipe_shopping_carts([recipe.pk], ingredients)
+
+    def delete_model(self, request, obj):
+        self.delete_queryset(request, Recipe.objects.filter(pk=obj.pk))
+
+    def delete_queryset(self, request, queryset):
+        recipes = list(queryset.values_list("pk", flat=True))
+        users = list(
+            ShoppingCart.objects.filter(recipe__in=recipes)
+            .values_list("user", flat=True)
+            .distinct()
+        )
+        ingredients = list(self.get_ingredients(recipes))
+        super().delete_queryset(request, queryset)
+        if users:
+            refresh_shopping_cart_totals(users, ingredients)
+
+    def get_ingredients(self, recipes):
+        return (
+            RecipeIngredient.objects.filter(recipe__in=recipes)
+            .values_list("ingredient", flat=True)
+            .distinct()
+        )
 
 
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
     list_display = ["name", "color", "slug"]
+    search_fields = ["name", "slug"]
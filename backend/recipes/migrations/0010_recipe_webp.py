@@ -0,0 +1,18 @@
+# Generated by Django 3.2.15 on 2026-10-18 05:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_similarrecipe'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='webp',
+            field=models.ImageField(blank=True, editable=False, upload_to='recipe_images/', verbose_name='Картинка в WebP'),
+        ),
+    ]
@@ -1,9 +1,30 @@
 from django.contrib.auth import get_user_model
-from django.db import models
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+    SearchVectorField,
+)
 from django.core.validators import MinValueValidator
+from django.db import connections, models
+from django.db.models import (
+    Case,
+    Exists,
+    F,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    Value,
+    When,
+)
+
+from users.models import Follow
 
 User = get_user_model()
 
+SEARCH_CONFIG = "russian"
+
 
 class Tag(models.Model):
     name = models.CharField("Название", max_length=200, unique=True)
@@ -26,6 +47,96 @@ class Ingredient(models.Model):
         verbose_name_plural = "Ингредиенты"
 
 
+class RecipeQuerySet(models.QuerySet):
+    def with_user_flags(self, user):
+        if user.is_anonymous:
+            return self.annotate(
+                is_favorited=Value(False, output_field=models.BooleanField()),
+                is_in_shopping_cart=Value(
+                    False, output_field=models.BooleanField()
+                ),
+                is_subscribed=Value(False, output_field=models.BooleanField()),
+            )
+        return self.annotate(
+            is_favorited=Exists(
+                FavoriteRecipes.objects.filter(
+                    user=user, recipe=OuterRef("pk")
+                )
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef("pk"))
+            ),
+            is_subscribed=Exists(
+                Follow.objects.filter(user=user, author=OuterRef("author"))
+            ),
+        )
+
+    def for_representation(self, user):
+        return (
+            self.with_user_flags(user)
+            .select_related("author")
+            .defer("search_vector")
+            .prefetch_related(
+                "tags",
+                Prefetch(
+                    "ingredient",
+                    queryset=RecipeIngredient.objects.select_related(
+                        "ingredient"
+                    ).order_by("ingredient__name"),
+                ),
+            )
+        )
+
+    def search(self, value):
+        if connections[self.db].vendor == "postgresql":
+            query = SearchQuery(
+                value, config=SEARCH_CONFIG, search_type="websearch"
+            )
+            queryset = self.filter(search_vector=query).annotate(
+                search_rank=SearchRank(F("search_vector"), query)
+            )
+        else:
+            queryset = self.annotate(
+                search_rank=Case(
+                    When(name__icontains=value, then=Value(1.0)),
+                    When(
+                        Exists(
+                            RecipeIngredient.objects.filter(
+                                recipe=OuterRef("pk"),
+                                ingredient__name__icontains=value,
+                            )
+                        ),
+                        then=Value(0.4),
+                    ),
+                    When(text__icontains=value, then=Value(0.2)),
+                    default=Value(0.0),
+                    output_field=models.FloatField(),
+                )
+            ).filter(search_rank__gt=0)
+        return queryset.order_by("-search_rank", "-pub_date", "-id")
+
+    def update_search_vector(self):
+        if connections[self.db].vendor != "postgresql":
+            return 0
+        ingredient_names = (
+            RecipeIngredient.objects.filter(recipe=OuterRef("pk"))
+            .values("recipe")
+            .annotate(names=StringAgg("ingredient__name", " "))
+            .values("names")
+        )
+        return self.update(
+            search_vector=(
+                SearchVector("name", weight="A", config=SEARCH_CONFIG)
+                + SearchVector(
+                    Subquery(ingredient_names),
+                    weight="B",
+                    config=SEARCH_CONFIG,
+                )
+                + SearchVector("text", weight="C", config=SEARCH_CONFIG)
+            )
+        )
+
+
 class Recipe(models.Model):
     author = models.ForeignKey(
         User,
@@ -35,6 +146,18 @@ class Recipe(models.Model):
     )
     name = models.CharField("Название", max_length=200)
     image = models.ImageField("Картинка", upload_to="recipe_images/")
+    thumbnail = models.ImageField(
+        "Миниатюра",
+        upload_to="recipe_images/",
+        blank=True,
+        editable=False,
+    )
+    webp = models.ImageField(
+        "Картинка в WebP",
+        upload_to="recipe_images/",
+        blank=True,
+        editable=False,
+    )
     text = models.TextField("Описание")
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -60,11 +183,31 @@ class Recipe(models.Model):
         auto_now_add=True,
         editable=False,
     )
+    favorites_count = models.PositiveIntegerField(
+        "В избранном", default=0, editable=False
+    )
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
         ordering = ["-pub_date"]
+        indexes = [
+            models.Index(
+                fields=["-pub_date", "-id"],
+                name="recipe_pub_date_idx",
+            ),
+            models.Index(
+                fields=["author", "-pub_date", "-id"],
+                name="recipe_author_pub_date_idx",
+            ),
+            models.Index(
+                fields=["-favorites_count", "-id"],
+                name="recipe_favorites_count_idx",
+            ),
+        ]
 
 
 class RecipeIngredient(models.Model):
@@ -102,6 +245,12 @@ class RecipeIngredient(models.Model):
                 name="unique_ingredient_in_recipe",
             )
         ]
+        indexes = [
+            models.Index(
+                fields=["ingredient", "recipe", "amount"],
+                name="recipe_ingredient_amount_idx",
+            ),
+        ]
 
 
 class FavoriteRecipes(models.Model):
@@ -158,3 +307,61 @@ class ShoppingCart(models.Model):
                 name="unique_recipe_in_cart",
             ),
         ]
+
+
+class ShoppingCartIngredient(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_cart_ingredients",
+        verbose_name="Пользователь",
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name="in_shopping_carts",
+        verbose_name="Ингредиент",
+    )
+    total_amount = models.PositiveIntegerField("Количество")
+
+    class Meta:
+        verbose_name = "Ингредиенты корзины пользователя"
+        verbose_name_plural = "Ингредиенты корзины пользователя"
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    "user",
+                    "ingredient",
+                ],
+                name="unique_ingredient_in_cart_totals",
+            ),
+        ]
+
+
+class SimilarRecipe(models.Model):
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="similar",
+        verbose_name="Рецепт",
+    )
+    similar = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name="similar_to",
+        verbose_name="Похожий рецепт",
+    )
+    score = models.FloatField("Сходство")
+
+    class Meta:
+        verbose_name = "Похожий рецепт"
+        verbose_name_plural = "Похожие рецепты"
+        constraints = [
+            models.UniqueConstraint(
+                fields=[
+                    "recipe",
+                    "similar",
+                ],
+                name="unique_similar_recipe",
+            ),
+        ]
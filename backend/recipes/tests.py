@@ -0,0 +1,170 @@
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase
+
+from api.seeding import seed_dataset
+
+from .models import (
+    Recipe,
+    RecipeIngredient,
+    ShoppingCart,
+    ShoppingCartIngredient,
+    Tag,
+)
+from .paginators import EstimatedCountPaginator
+
+User = get_user_model()
+
+CHANGELISTS = {
+    "recipe": 5,
+    "recipeingredient": 4,
+    "favoriterecipes": 4,
+    "shoppingcart": 4,
+}
+
+
+class AdminChangelistQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(users=20, recipes=300, ingredients=60)
+        cls.admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="pw-12345"
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def assert_changelist(self, model, queries, **params):
+        url = f"/admin/recipes/{model}/"
+        self.client.get(url, params)
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_changelists(self):
+        for model, queries in CHANGELISTS.items():
+            with self.subTest(model=model):
+                self.assert_changelist(model, queries)
+
+    def test_recipe_changelist_filtered_by_tag(self):
+        tag = Tag.objects.first()
+        response = self.assert_changelist("recipe", 5, tag=tag.slug)
+        self.assertEqual(
+            response.context["cl"].result_count,
+            Recipe.objects.filter(tags=tag).count(),
+        )
+
+    def test_recipe_changelist_search(self):
+        self.assert_changelist("recipe", 5, q="a")
+
+
+class AdminShoppingCartTotalsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(users=10, recipes=30, ingredients=20, carts=5)
+        call_command("shopping_cart_totals", stdout=StringIO())
+        cls.admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="pw-12345"
+        )
+        cls.cart = ShoppingCart.objects.order_by("id").first()
+        cls.item = RecipeIngredient.objects.filter(
+            recipe=cls.cart.recipe_id
+        ).first()
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def tearDown(self):
+        call_command("shopping_cart_totals", "--check", stdout=StringIO())
+
+    def post(self, url, data):
+        response = self.client.post(f"/admin/recipes/{url}", data)
+        self.assertEqual(response.status_code, 302)
+
+    def total(self):
+        return ShoppingCartIngredient.objects.get(
+            user=self.cart.user_id, ingredient=self.item.ingredient_id
+        ).total_amount
+
+    def test_recipe_ingredient_change(self):
+        total = self.total()
+        self.post(
+            f"recipeingredient/{self.item.id}/change/",
+            {
+                "recipe": self.item.recipe_id,
+                "ingredient": self.item.ingredient_id,
+                "amount": self.item.amount + 100,
+            },
+        )
+        self.assertEqual(self.total(), total + 100)
+
+    def test_recipe_ingredient_delete(self):
+        self.post(f"recipeingredient/{self.item.id}/delete/", {"post": "yes"})
+
+    def test_shopping_cart_add_and_delete(self):
+        recipe = Recipe.objects.exclude(
+            shopping_cart__user=self.cart.user_id
+        ).first()
+        self.post(
+            "shoppingcart/add/",
+            {"user": self.cart.user_id, "recipe": recipe.id},
+        )
+        self.post(f"shoppingcart/{self.cart.id}/delete/", {"post": "yes"})
+
+    def test_recipe_inline_change(self):
+        recipe = self.cart.recipe
+        items = list(recipe.ingredient.order_by("id"))
+        data = {
+            "name": recipe.name,
+            "author": recipe.author_id,
+            "text": recipe.text,
+            "tags": list(recipe.tags.values_list("id", flat=True)),
+            "cooking_time": recipe.cooking_time,
+            "ingredient-TOTAL_FORMS": len(items),
+            "ingredient-INITIAL_FORMS": len(items),
+            "ingredient-MIN_NUM_FORMS": 1,
+            "ingredient-MAX_NUM_FORMS": 1000,
+        }
+        for index, item in enumerate(items):
+            prefix = f"ingredient-{index}-"
+            data.update(
+                {
+                    f"{prefix}id": item.id,
+                    f"{prefix}recipe": recipe.id,
+                    f"{prefix}ingredient": item.ingredient_id,
+                    f"{prefix}amount": item.amount + 10,
+                }
+            )
+        data["ingredient-0-DELETE"] = "on"
+        self.post(f"recipe/{recipe.id}/change/", data)
+        self.assertEqual(recipe.ingredient.count(), len(items) - 1)
+
+    def test_recipe_delete(self):
+        self.post(f"recipe/{self.cart.recipe_id}/delete/", {"post": "yes"})
+
+
+class EstimatedCountPaginatorTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(users=5, recipes=50, ingredients=20)
+
+    def test_small_table_is_counted_exactly(self):
+        paginator = EstimatedCountPaginator(Recipe.objects.order_by("id"), 10)
+        with self.assertNumQueries(
+            2 if connection.vendor == "postgresql" else 1
+        ):
+            self.assertEqual(paginator.count, 50)
+
+    @skipUnless(
+        connection.vendor == "postgresql", "estimates need PostgreSQL"
+    )
+    def test_large_table_uses_planner_estimate(self):
+        paginator = EstimatedCountPaginator(Recipe.objects.order_by("id"), 10)
+        with mock.patch("recipes.paginators.EXACT_COUNT_LIMIT", 10):
+            with self.assertNumQueries(1):
+                self.assertGreater(paginator.count, 10)
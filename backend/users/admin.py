@@ -1,6 +1,8 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
 
+from recipes.paginators import EstimatedCountPaginator
+
 from .models import Follow, User
 
 
@@ -12,9 +14,13 @@ class CustomUserAdmin(UserAdmin):
         "email",
         "first_name",
         "last_name",
+        "recipes_count",
+        "followers_count",
     ]
-    list_filter = ["email", "username"]
+    list_filter = ["is_staff", "is_superuser", "is_active"]
     search_fields = ["username", "email"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 
 @admin.register(Follow)
@@ -23,3 +29,7 @@ class FollowAdmin(admin.ModelAdmin):
         "user",
         "author",
     ]
+    list_select_related = ["user", "author"]
+    autocomplete_fields = ["user", "author"]
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
@@ -20,6 +20,12 @@ class User(AbstractUser):
         max_length=254,
         unique=True,
     )
+    recipes_count = models.PositiveIntegerField(
+        "Количество рецептов", default=0, editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        "Количество подписчиков", default=0, editable=False
+    )
 
     class Meta:
         verbose_name = "Пользователь"
@@ -51,3 +57,9 @@ class Follow(models.Model):
                 name="cant_subscribe_to_yourself",
             ),
         ]
+        indexes = [
+            models.Index(
+                fields=["user", "author"],
+                name="follow_user_author_idx",
+            ),
+        ]
@@ -0,0 +1,36 @@
+from django.contrib.auth import get_user_model
+from django.test import TestCase
+
+from api.seeding import seed_dataset
+
+User = get_user_model()
+
+
+class AdminChangelistQueriesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        seed_dataset(users=150, recipes=100, ingredients=20)
+        cls.admin = User.objects.create_superuser(
+            username="admin", email="admin@example.com", password="pw-12345"
+        )
+
+    def setUp(self):
+        self.client.force_login(self.admin)
+
+    def assert_changelist(self, model, queries, **params):
+        url = f"/admin/users/{model}/"
+        self.client.get(url, params)
+        with self.assertNumQueries(queries):
+            response = self.client.get(url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context["cl"].result_list), 100)
+        return response
+
+    def test_user_changelist(self):
+        self.assert_changelist("user", 4)
+
+    def test_user_changelist_filtered(self):
+        self.assert_changelist("user", 4, is_active__exact=1)
+
+    def test_follow_changelist(self):
+        self.assert_changelist("follow", 4)